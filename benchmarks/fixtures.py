@@ -0,0 +1,276 @@
+"""
+Reproducible synthetic corpora, for the benchmarks and for load testing.
+
+A corpus has the layout of the `data/` folder: NARC brat annotations
+(`.ann` + `.txt`), a UD treebank with train/test/dev splits and a NorNE
+entity treebank with the same sentences, for both languages. It is
+generated from a seed, so the same CorpusConfig always gives the same
+files, and it is written one document at a time, so its size is only
+limited by the disk. The pipeline runs on it like on the real data:
+
+    python benchmarks/fixtures.py /tmp/corpus --docs 3000
+    cd /tmp/corpus && ln -s /path/to/UD-NARC/ud_narc ud_narc && python ud_narc/pipeline.py
+"""
+import os
+import random
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, List, Tuple
+
+LANGUAGES = {"bokmaal": ("nob", "Bokmaal"), "nynorsk": ("nno", "Nynorsk")}
+SPLITS = ["train", "test", "dev"]
+NARC_VERSION = "v1.0"
+
+WORDS = (
+    "hun han det er en et bil hus mann kvinne by skole Oslo Bergen kom gikk "
+    "så hadde var ikke også etter før stor liten ny gammel"
+).split()
+# sentences that occur in many documents, and need disambiguation in build_map
+REPEATED = ["Det er bra .", "Hei !", "Nyheter :"]
+PUNCT = ".!?:"
+
+
+@dataclass
+class CorpusConfig:
+    """
+    The knobs of a synthetic corpus. Ranges are inclusive, rates are
+    probabilities.
+
+    Attributes:
+        docs: documents per language, spread evenly over the splits (the first
+            splits get one more if it is not a multiple of their number)
+        sentences: number of sentences of a document
+        sentence_length: number of words of a sentence, before its punctuation
+        vocabulary: number of distinct words, common words come first
+        mention_density: markables per sentence, on average
+        mention_length: number of words of a markable
+        nesting_rate: chance that a markable of several words contains another one
+        max_nesting_depth: markables nested in each other, at most (1 for no nesting)
+        discontinuous_rate: chance that a markable of 3 or more words skips its middle
+        coref_rate: chance that a markable corefers with an earlier one
+        bridging_rate: chance of a bridging link from a markable to an earlier one
+        split_antecedent_rate: chance of a split antecedent link to an earlier markable
+        duplicate_rate: chance that a sentence is one of a few sentences shared
+            by many documents, which build_map has to disambiguate
+    """
+
+    docs: int = 30
+    sentences: Tuple[int, int] = (2, 8)
+    sentence_length: Tuple[int, int] = (3, 12)
+    vocabulary: int = len(WORDS)
+    mention_density: float = 1.0
+    mention_length: Tuple[int, int] = (1, 3)
+    nesting_rate: float = 0.0
+    max_nesting_depth: int = 1
+    discontinuous_rate: float = 0.1
+    coref_rate: float = 0.5
+    bridging_rate: float = 0.1
+    split_antecedent_rate: float = 0.05
+    duplicate_rate: float = 0.15
+
+
+def get_fixture_paths(root: str, lang: str) -> Dict[str, str]:
+    code, name = LANGUAGES[lang]
+    return {
+        "annotations": os.path.join(root, "data", "narc", "data", NARC_VERSION, f"annotation_{lang}"),
+        "ud": os.path.join(root, "data", "UD", f"UD_Norwegian-{name}"),
+        "norne": os.path.join(root, "data", "norne", "ud", code),
+    }
+
+
+def make_vocabulary(size: int) -> List[str]:
+    # the common words, then made-up ones from alternating consonants and vowels
+    words = WORDS[:size]
+    consonants, vowels = "bdfghjklmnprstv", "aeiouyæøå"
+    i = 0
+    while len(words) < size:
+        word, n = "", i
+        for _ in range(3):
+            word += consonants[n % len(consonants)] + vowels[(n // len(consonants)) % len(vowels)]
+            n //= len(consonants) * len(vowels)
+        words.append(word)
+        i += 1
+    return words
+
+
+class _Generator:
+    def __init__(self, config: CorpusConfig, seed: int):
+        self.config = config
+        self.rng = random.Random(seed)
+        self.words = make_vocabulary(config.vocabulary)
+        self.stats = {"documents": 0, "sentences": 0, "tokens": 0, "markables": 0,
+                      "nested": 0, "discontinuous": 0, "coref": 0, "bridging": 0,
+                      "split_antecedent": 0, "duplicates": 0}
+
+    def sentence(self) -> List[str]:
+        rng = self.rng
+        if rng.random() < self.config.duplicate_rate:
+            self.stats["duplicates"] += 1
+            return rng.choice(REPEATED).split()
+        tokens = [rng.choice(self.words) for _ in range(rng.randint(*self.config.sentence_length))]
+        tokens[0] = tokens[0].capitalize()
+        tokens.append(rng.choice([".", "!", "?"]))
+        return tokens
+
+    def _span(self, first: int, last: int, max_length: int) -> Tuple[int, int]:
+        # a span of words within [first, last]
+        low = min(self.config.mention_length[0], max_length)
+        length = min(self.rng.randint(low, max_length), last - first + 1)
+        start = self.rng.randint(first, last - length + 1)
+        return start, start + length - 1
+
+    def markables(self, sents: List[List[str]]) -> List[Tuple[int, int]]:
+        """
+        Returns:
+            List[Tuple[int, int]]: first and last token (in the document) of every markable
+        """
+        config, rng = self.config, self.rng
+        spans = []
+        offset = 0
+        for tokens in sents:
+            # markables do not cover the final punctuation of their sentence
+            last = offset + len(tokens) - 1
+            while last >= offset and tokens[last - offset] in PUNCT:
+                last -= 1
+            n = int(config.mention_density) + (rng.random() < config.mention_density % 1)
+            if last >= offset:
+                for _ in range(n):
+                    span = self._span(offset, last, config.mention_length[1])
+                    spans.append(span)
+                    depth = 1
+                    while (depth < config.max_nesting_depth and span[1] > span[0]
+                           and rng.random() < config.nesting_rate):
+                        # a strictly shorter markable inside the previous one
+                        span = self._span(span[0], span[1], span[1] - span[0])
+                        spans.append(span)
+                        self.stats["nested"] += 1
+                        depth += 1
+            offset += len(tokens)
+        return spans
+
+    def annotations(self, sents: List[List[str]]) -> List[str]:
+        config, rng = self.config, self.rng
+        char_offsets = []
+        pos = 0
+        for tokens in sents:
+            for token in tokens:
+                char_offsets.append((pos, pos + len(token)))
+                pos += len(token) + 1
+
+        lines = []
+        markables = self.markables(sents)
+        for i, (start, end) in enumerate(markables, start=1):
+            if end > start + 1 and rng.random() < config.discontinuous_rate:
+                spans = f"{char_offsets[start][0]} {char_offsets[start][1]};{char_offsets[end][0]} {char_offsets[end][1]}"
+                self.stats["discontinuous"] += 1
+            else:
+                spans = f"{char_offsets[start][0]} {char_offsets[end][1]}"
+            lines.append(f"T{i}\tMarkable {spans}\tx\n")
+        self.stats["markables"] += len(markables)
+
+        n_links = 0
+        for i in range(2, len(markables) + 1):
+            for link, rate in [("Coref", config.coref_rate), ("Bridging", config.bridging_rate),
+                               ("Split_antecedent", config.split_antecedent_rate)]:
+                if rng.random() >= rate:
+                    continue
+                other = rng.randint(1, i - 1)
+                n_links += 1
+                if link == "Coref":
+                    lines.append(f"R{n_links}\tCoref Arg1:T{other} Arg2:T{i}\t\n")
+                else:
+                    lines.append(f"R{n_links}\t{link} Arg1:T{i} Arg2:T{other}\t\n")
+                self.stats[link.lower()] += 1
+        return lines
+
+    def document(self) -> List[List[str]]:
+        sents = [self.sentence() for _ in range(self.rng.randint(*self.config.sentences))]
+        self.stats["documents"] += 1
+        self.stats["sentences"] += len(sents)
+        self.stats["tokens"] += sum(len(tokens) for tokens in sents)
+        return sents
+
+
+def _conllu_lines(sent_id: int, tokens: List[str], heads: List[int], names: bool) -> List[str]:
+    lines = [f"# sent_id = {sent_id:06d}\n", f"# text = {' '.join(tokens)}\n"]
+    for i, (token, head) in enumerate(zip(tokens, heads)):
+        deprel = "root" if head == 0 else "nsubj"
+        misc = f"name={'B-PER' if token[0].isupper() else 'O'}" if names else "_"
+        lines.append(f"{i + 1}\t{token}\t{token.lower()}\tNOUN\t_\t_\t{head}\t{deprel}\t_\t{misc}\n")
+    lines.append("\n")
+    return lines
+
+
+def write_corpus(root: str, config: CorpusConfig = CorpusConfig(), seed: int = 0) -> Dict[str, int]:
+    """
+    Writes a synthetic corpus to root, see CorpusConfig.
+
+    Returns:
+        Dict[str, int]: counts of the documents, sentences, tokens, markables
+            and links written, over both languages
+    """
+    generator = _Generator(config, seed)
+    for lang in LANGUAGES:
+        paths = get_fixture_paths(root, lang)
+        for folder in paths.values():
+            os.makedirs(folder, exist_ok=True)
+
+        sent_id = 0
+        for k, split in enumerate(SPLITS):
+            n_docs = config.docs // len(SPLITS) + (k < config.docs % len(SPLITS))
+            split_file = f"no_{lang}-ud-{split}.conllu"
+            with open(os.path.join(paths["ud"], split_file), "w", encoding="utf-8", newline="\n") as ud_f, \
+                    open(os.path.join(paths["norne"], split_file), "w", encoding="utf-8", newline="\n") as norne_f:
+                for i in range(n_docs):
+                    doc_id = f"{lang[:2]}~{split}-{i:04d}"
+                    sents = generator.document()
+                    for tokens in sents:
+                        sent_id += 1
+                        heads = [0] + [generator.rng.randint(1, j) for j in range(1, len(tokens))]
+                        ud_f.write("".join(_conllu_lines(sent_id, tokens, heads, names=False)))
+                        norne_f.write("".join(_conllu_lines(sent_id, tokens, heads, names=True)))
+
+                    base = os.path.join(paths["annotations"], doc_id)
+                    with open(f"{base}.txt", "w", encoding="utf-8", newline="\n") as f:
+                        f.write("".join(" ".join(tokens) + "\n" for tokens in sents))
+                    with open(f"{base}.ann", "w", encoding="utf-8", newline="\n") as f:
+                        f.write("".join(generator.annotations(sents)))
+    return generator.stats
+
+
+def write_fixture(root: str, n_docs: int = 30, seed: int = 0) -> Dict[str, int]:
+    """
+    Writes a corpus of n_docs documents per language with the default knobs.
+    """
+    return write_corpus(root, CorpusConfig(docs=n_docs), seed=seed)
+
+
+def _range(value: str) -> Tuple[int, int]:
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Writes a synthetic NARC/UD/NorNE corpus")
+    parser.add_argument("root", help="Folder to write the corpus to")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1,
+                        help="Multiplies the number of documents, e.g. 10 or 100")
+    defaults = CorpusConfig()
+    for field in fields(CorpusConfig):
+        default = getattr(defaults, field.name)
+        if isinstance(default, tuple):
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=_range,
+                                default=default, metavar="MIN-MAX",
+                                help=f"(default: {default[0]}-{default[1]})")
+        else:
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(default),
+                                default=default, help=f"(default: {default})")
+    args = parser.parse_args()
+
+    config = CorpusConfig(**{field.name: getattr(args, field.name) for field in fields(CorpusConfig)})
+    config.docs = int(config.docs * args.scale)
+    print(f"Writing a corpus to {args.root}: {asdict(config)}")
+    stats = write_corpus(args.root, config, seed=args.seed)
+    print(", ".join(f"{count} {name}" for name, count in stats.items()))
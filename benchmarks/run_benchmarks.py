@@ -0,0 +1,385 @@
+"""
+Times the stages of the pipeline one by one on a reproducible fixture
+(see fixtures.py) and saves the results as JSON, to compare runs.
+
+Every stage is run --repeat times and the fastest run counts. Its inputs
+are prepared outside of the timed region, and one more run measures the
+peak memory allocated by the stage, with tracemalloc. Every run starts with
+a cold text normalization cache, so that it does not depend on the runs and
+stages before it.
+
+Usage: python benchmarks/run_benchmarks.py [--docs N] [--stages ...] [--compare BASELINE.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+for folder in ["ud_narc", "converters", "visualization"]:
+    sys.path.insert(0, os.path.join(REPO_ROOT, folder))
+sys.path.insert(0, BENCHMARKS)
+
+from fixtures import get_fixture_paths, write_fixture
+
+LANG = "bokmaal"
+
+
+class Run(NamedTuple):
+    """A prepared stage: the call to time, and how much data it processes."""
+
+    func: Callable[[], object]
+    docs: Optional[int]
+    tokens: Optional[int]
+
+
+class Context:
+    """
+    The fixture, and the inputs of the stages, each built on first use by
+    running the stages before it once, untimed.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.paths = get_fixture_paths(root, LANG)
+        self.work = os.path.join(root, "work")
+
+    def folder(self, name: str) -> str:
+        path = os.path.join(self.work, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @cached_property
+    def ann_files(self) -> List[str]:
+        folder = self.paths["annotations"]
+        return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(".ann")]
+
+    @cached_property
+    def jsons(self) -> List[dict]:
+        from conversion import Ann2Json
+
+        jsons = []
+        for file in self.ann_files:
+            parser = Ann2Json(file)
+            parser.parse()
+            jsons.append(parser.json)
+        return jsons
+
+    @cached_property
+    def conll_folder(self) -> str:
+        from conversion import Json2Conll
+
+        folder = self.folder("conll")
+        for data in self.jsons:
+            parser = Json2Conll.from_json(data)
+            parser.parse()
+            parser.write(os.path.join(folder, f"{data['doc_key']}.conllu"))
+        return folder
+
+    @cached_property
+    def ud_index(self):
+        from alignment import UDIndex
+        from util import get_ud_split_paths
+
+        return UDIndex.build(get_ud_split_paths(self.paths["ud"], LANG))
+
+    def build_map(self) -> None:
+        from alignment import build_map
+
+        build_map(self.ud_index, self.paths["annotations"], self.folder("ud_splits"),
+                  self.folder("doc2sent"))
+
+    @cached_property
+    def doc2sentids(self) -> Dict[str, List[str]]:
+        from alignment import load_split2doc2sentids
+
+        self.build_map()
+        return {
+            doc: sentids
+            for doc2sentids in load_split2doc2sentids(self.folder("doc2sent")).values()
+            for doc, sentids in doc2sentids.items()
+        }
+
+    def merge_inputs(self):
+        # fresh sentences on every call, as merge_conllus changes the UD sentences
+        from alignment import load_narc_doc
+
+        sentid2ud = self.ud_index.read_sentences(
+            sentid for sentids in self.doc2sentids.values() for sentid in sentids)
+        return [
+            (doc, sentids, load_narc_doc(self.conll_folder, doc), [sentid2ud[s] for s in sentids])
+            for doc, sentids in self.doc2sentids.items()
+        ]
+
+    @cached_property
+    def merged_docs(self) -> list:
+        # the merged documents, as iter_docs of conll_to_jsonl reads them
+        from alignment import merge_conllus
+        from conllu import parse
+
+        docs = []
+        for doc, _, narc_sents, ud_sents in self.merge_inputs():
+            pieces = [f"# newdoc id = {doc}\n", "# global.Entity = eid-etype-head-other\n"]
+            for narc_sent, ud_sent in zip(narc_sents, ud_sents):
+                pieces.append(merge_conllus(narc_sent, ud_sent).serialize())
+            docs.append(parse("".join(pieces)))
+        return docs
+
+    @cached_property
+    def parsed_docs(self) -> List[dict]:
+        from conll_to_jsonl import parse_doc
+
+        return [parse_doc(doc, part_id=i) for i, doc in enumerate(self.merged_docs)]
+
+    def read_treebank(self, folder: str) -> list:
+        from util import read_sentences
+
+        sents = []
+        for split in ["train", "test", "dev"]:
+            with open(os.path.join(folder, f"no_{LANG}-ud-{split}.conllu"), encoding="utf-8") as f:
+                sents.extend(read_sentences(f))
+        return sents
+
+
+def _json_tokens(jsons: List[dict]) -> int:
+    return sum(len(data["tokens"]) for data in jsons)
+
+
+def _doc_tokens(docs: list) -> int:
+    return sum(len(sent) for doc in docs for sent in doc)
+
+
+# each stage prepares its input from the context and returns the call to time
+def ann2json_parse(ctx: Context) -> Run:
+    from conversion import Ann2Json
+
+    parsers = [Ann2Json(file) for file in ctx.ann_files]
+    return Run(lambda: [parser.parse() for parser in parsers], len(parsers), _json_tokens(ctx.jsons))
+
+
+def json2conll_parse(ctx: Context) -> Run:
+    from conversion import Json2Conll
+
+    parsers = [Json2Conll.from_json(data) for data in ctx.jsons]
+    return Run(lambda: [parser.parse() for parser in parsers], len(parsers), _json_tokens(ctx.jsons))
+
+
+def json2conll_write(ctx: Context) -> Run:
+    from conversion import Json2Conll
+
+    parsers = [Json2Conll.from_json(data) for data in ctx.jsons]
+    for parser in parsers:
+        parser.parse()
+    folder = ctx.folder("conll_write")
+
+    def write():
+        for parser in parsers:
+            parser.write(os.path.join(folder, f"{parser._id}.conllu"))
+
+    return Run(write, len(parsers), _json_tokens(ctx.jsons))
+
+
+def build_map(ctx: Context) -> Run:
+    ctx.ud_index  # built outside of the timed region
+    return Run(ctx.build_map, len(ctx.ann_files), _json_tokens(ctx.jsons))
+
+
+def build_cost_matrix(ctx: Context) -> Run:
+    # every fourth sentence of each document is made ambiguous, and scored
+    # against the UD sentences of all of them, like a frequent ambiguous sentence text
+    from alignment.utils_merge import SentIdIndex, build_cost_matrix as _build_cost_matrix
+
+    rng = random.Random(0)
+    doc2index, narc_ids, ud_ids = {}, [], []
+    for doc, sentids in ctx.doc2sentids.items():
+        masked = list(sentids)
+        for i in range(0, len(masked), 4):
+            narc_ids.append((doc, i))
+            ud_ids.append(masked[i])
+            masked[i] = None
+        doc2index[doc] = SentIdIndex(masked)
+    rng.shuffle(ud_ids)
+    return Run(lambda: _build_cost_matrix(narc_ids, ud_ids, doc2index), len(doc2index), None)
+
+
+def merge_conllus(ctx: Context) -> Run:
+    from alignment import merge_conllus as _merge_conllus
+
+    inputs = ctx.merge_inputs()
+    pairs = [pair for _, _, narc_sents, ud_sents in inputs for pair in zip(narc_sents, ud_sents)]
+    tokens = sum(len(ud_sent) for _, ud_sent in pairs)
+    return Run(lambda: [_merge_conllus(narc, ud) for narc, ud in pairs], len(inputs), tokens)
+
+
+def align_sentences(ctx: Context) -> Run:
+    from sentence_alignment import align_sentences as _align_sentences
+
+    ud = ctx.read_treebank(ctx.paths["ud"])
+    norne = ctx.read_treebank(ctx.paths["norne"])
+    return Run(lambda: _align_sentences(ud, norne), None, sum(len(sent) for sent in ud))
+
+
+def parse_doc(ctx: Context) -> Run:
+    from conll_to_jsonl import parse_doc as _parse_doc
+
+    docs = ctx.merged_docs
+    return Run(lambda: [_parse_doc(doc, part_id=i) for i, doc in enumerate(docs)],
+               len(docs), _doc_tokens(docs))
+
+
+def to_html(ctx: Context) -> Run:
+    from visualize import to_html as _to_html
+
+    docs = ctx.parsed_docs
+    tokens = sum(len(doc["cased_words"]) for doc in docs)
+    return Run(lambda: [_to_html(doc["cased_words"], doc["clusters"]) for doc in docs], len(docs), tokens)
+
+
+STAGES: Dict[str, Callable[[Context], Run]] = {
+    "Ann2Json.parse": ann2json_parse,
+    "Json2Conll.parse": json2conll_parse,
+    "Json2Conll.write": json2conll_write,
+    "build_map": build_map,
+    "build_cost_matrix": build_cost_matrix,
+    "merge_conllus": merge_conllus,
+    "align_sentences": align_sentences,
+    "conll_to_jsonl.parse_doc": parse_doc,
+    "visualization.to_html": to_html,
+}
+
+
+@contextlib.contextmanager
+def quiet():
+    # the stages print progress and warnings, which would drown the results
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+
+def clear_caches() -> None:
+    from alignment.utils_merge import preprocess_text
+
+    preprocess_text.cache_clear()
+
+
+def measure(ctx: Context, stage: Callable[[Context], Run], repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        with quiet():
+            run = stage(ctx)
+            clear_caches()
+            start = time.perf_counter()
+            run.func()
+            times.append(time.perf_counter() - start)
+
+    with quiet():
+        run = stage(ctx)
+        clear_caches()
+        tracemalloc.start()
+        try:
+            run.func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    seconds = min(times)
+    result = {"seconds": seconds, "runs": times, "docs": run.docs, "tokens": run.tokens,
+              "peak_memory_mib": peak / (1 << 20)}
+    if run.docs is not None:
+        result["docs_per_s"] = run.docs / seconds if seconds else None
+    if run.tokens is not None:
+        result["tokens_per_s"] = run.tokens / seconds if seconds else None
+    return result
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_rate(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:,.0f}"
+
+
+def compare(results: dict, baseline: dict) -> None:
+    print(f"\nCompared to {baseline.get('commit')} ({baseline.get('created')}):")
+    if baseline.get("fixture") != results["fixture"]:
+        print(f"Note: the fixtures differ, {baseline.get('fixture')} and {results['fixture']}")
+    for name, result in results["stages"].items():
+        before = baseline["stages"].get(name)
+        if "seconds" not in result or not before or "seconds" not in before:
+            continue
+        speedup = before["seconds"] / result["seconds"] if result["seconds"] else float("inf")
+        print(f"{name:<28} {before['seconds'] * 1000:9.1f} ms -> {result['seconds'] * 1000:9.1f} ms"
+              f"  x{speedup:.2f}  memory {before['peak_memory_mib']:.1f} -> {result['peak_memory_mib']:.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=300, help="Documents per language in the fixture")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fixture")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage, the fastest counts")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES),
+                        help="Stages to benchmark (default: all)")
+    parser.add_argument("--output", help="JSON file for the results "
+                        "(default: benchmarks/results/{commit}.json)")
+    parser.add_argument("--compare", help="Results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fixture": {"docs": args.docs, "seed": args.seed, "language": LANG},
+        "repeat": args.repeat,
+        "stages": {},
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        write_fixture(root, n_docs=args.docs, seed=args.seed)
+        # the stages resolve data/... paths relative to the working directory
+        os.chdir(root)
+        try:
+            ctx = Context(root)
+            print(f"{'stage':<28} {'time':>12} {'docs/s':>10} {'tokens/s':>12} {'peak memory':>12}")
+            for name in args.stages:
+                try:
+                    result = measure(ctx, STAGES[name], args.repeat)
+                except ImportError as e:
+                    # e.g. the visualization needs IPython
+                    results["stages"][name] = {"skipped": str(e)}
+                    print(f"{name:<28} skipped: {e}")
+                    continue
+                results["stages"][name] = result
+                print(f"{name:<28} {result['seconds'] * 1000:9.1f} ms"
+                      f" {format_rate(result.get('docs_per_s')):>10} {format_rate(result.get('tokens_per_s')):>12}"
+                      f" {result['peak_memory_mib']:8.1f} MiB")
+        finally:
+            os.chdir(cwd)
+
+    output = args.output or os.path.join(BENCHMARKS, "results", f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
@@ -0,0 +1,179 @@
+import json
+import os
+import sys
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from conll_to_jsonl import iter_docs, parse_doc
+
+# A split is exported as a directory of flat arrays, which are loaded as
+# read-only memory maps, such that data loader workers share their pages:
+#
+# meta.json             counts, document ids and the UPOS/deprel vocabularies
+# forms.bin             the UTF-8 encoded string table of all distinct forms
+# form_offsets.npy      int64 [n_forms + 1], byte offsets into forms.bin
+# form_ids.npy          int32 [n_words], word -> form
+# upos.npy, deprel.npy  int16 [n_words], word -> vocabulary index
+# head.npy              int32 [n_words], word -> head word within its document, -1 for None
+# sent_id.npy           int32 [n_words], word -> sentence within its document
+# doc_offsets.npy       int64 [n_docs + 1], word offsets of the documents
+# mention_start.npy     int32 [n_mentions], first word of a mention within its document
+# mention_end.npy       int32 [n_mentions], last word (inclusive) of a mention
+# chain_offsets.npy     int64 [n_chains + 1], mention offsets of the coreference chains
+# doc_chain_offsets.npy int64 [n_docs + 1], chain offsets of the documents
+#
+# Chains of a single mention are singletons, the others are the clusters of parse_doc.
+
+FORMAT_VERSION = 1
+META = "meta.json"
+
+
+class _Vocab:
+    def __init__(self):
+        self.index: Dict[Optional[str], int] = {}
+
+    def __call__(self, value: Optional[str]) -> int:
+        if value not in self.index:
+            self.index[value] = len(self.index)
+        return self.index[value]
+
+    @property
+    def values(self) -> List[Optional[str]]:
+        return list(self.index)
+
+
+def export_path(in_path, out_dir):
+    forms = _Vocab()
+    upos_vocab, deprel_vocab = _Vocab(), _Vocab()
+    columns = {
+        "form_ids": array("i"),
+        "upos": array("h"),
+        "deprel": array("h"),
+        "head": array("i"),
+        "sent_id": array("i"),
+        "doc_offsets": array("q", [0]),
+        "mention_start": array("i"),
+        "mention_end": array("i"),
+        "chain_offsets": array("q", [0]),
+        "doc_chain_offsets": array("q", [0]),
+    }
+    doc_ids = []
+
+    with open(in_path, encoding="utf-8") as f:
+        for part_id, _doc in enumerate(iter_docs(f)):
+            parsed = parse_doc(_doc, part_id=part_id)
+            doc_ids.append(parsed["document_id"])
+            columns["form_ids"].extend(forms(word) for word in parsed["cased_words"])
+            columns["upos"].extend(upos_vocab(pos) for pos in parsed["pos"])
+            columns["deprel"].extend(deprel_vocab(rel) for rel in parsed["deprel"])
+            columns["head"].extend(-1 if head is None else head for head in parsed["head"])
+            columns["sent_id"].extend(parsed["sent_id"])
+            columns["doc_offsets"].append(len(columns["form_ids"]))
+
+            for chain in parsed["mentions"]:
+                for start, end in chain:
+                    columns["mention_start"].append(start)
+                    columns["mention_end"].append(end)
+                columns["chain_offsets"].append(len(columns["mention_start"]))
+            columns["doc_chain_offsets"].append(len(columns["chain_offsets"]) - 1)
+
+    os.makedirs(out_dir, exist_ok=True)
+    encoded = [form.encode("utf-8") for form in forms.values]
+    with open(os.path.join(out_dir, "forms.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    form_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(form) for form in encoded], out=form_offsets[1:])
+    np.save(os.path.join(out_dir, "form_offsets.npy"), form_offsets)
+    for name, values in columns.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), np.frombuffer(values, dtype=values.typecode))
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "source": os.path.basename(in_path),
+        "n_docs": len(doc_ids),
+        "n_words": len(columns["form_ids"]),
+        "n_forms": len(encoded),
+        "n_chains": len(columns["chain_offsets"]) - 1,
+        "n_mentions": len(columns["mention_start"]),
+        "doc_ids": doc_ids,
+        "upos": upos_vocab.values,
+        "deprel": deprel_vocab.values,
+    }
+    with open(os.path.join(out_dir, META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+
+class ColumnarCorpus:
+    """
+    A split exported by export_path. The arrays are memory-mapped on first
+    access and never copied, documents are only decoded when asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar format version {self.meta['format_version']} in {path}")
+        self.doc_ids = self.meta["doc_ids"]
+        self.upos_vocab = self.meta["upos"]
+        self.deprel_vocab = self.meta["deprel"]
+        self._arrays = {}
+        self._forms = None
+
+    def __getattr__(self, name):
+        # the arrays, e.g. corpus.head or corpus.doc_offsets
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self._arrays:
+            file = os.path.join(self.path, f"{name}.npy")
+            if not os.path.exists(file):
+                raise AttributeError(name)
+            self._arrays[name] = np.load(file, mmap_mode="r")
+        return self._arrays[name]
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def forms(self) -> np.memmap:
+        if self._forms is None:
+            self._forms = np.memmap(os.path.join(self.path, "forms.bin"), dtype=np.uint8, mode="r")
+        return self._forms
+
+    def form(self, form_id: int) -> str:
+        start, end = self.form_offsets[form_id], self.form_offsets[form_id + 1]
+        return bytes(self.forms[start:end]).decode("utf-8")
+
+    def doc(self, i: int) -> dict:
+        """
+        Decodes document i into a JSONL line of conll_to_jsonl (spans as lists).
+        """
+        start, end = self.doc_offsets[i], self.doc_offsets[i + 1]
+        chains = []
+        for c in range(self.doc_chain_offsets[i], self.doc_chain_offsets[i + 1]):
+            m_start, m_end = self.chain_offsets[c], self.chain_offsets[c + 1]
+            chains.append([
+                [int(s), int(e)]
+                for s, e in zip(self.mention_start[m_start:m_end], self.mention_end[m_start:m_end])
+            ])
+        return {
+            "document_id": self.doc_ids[i],
+            "cased_words": [self.form(form_id) for form_id in self.form_ids[start:end]],
+            "sent_id": self.sent_id[start:end].tolist(),
+            "pos": [self.upos_vocab[pos] for pos in self.upos[start:end]],
+            "deprel": [self.deprel_vocab[rel] for rel in self.deprel[start:end]],
+            "head": [None if head < 0 else head for head in self.head[start:end].tolist()],
+            "clusters": [chain for chain in chains if len(chain) > 1],
+            "mentions": chains,
+        }
+
+
+if __name__ == "__main__":
+    in_path, out_path = sys.argv[1], sys.argv[2]
+    filename = in_path.split("/")[-1].replace(".conllu", "")
+    meta = export_path(in_path, os.path.join(out_path, filename))
+    print(f"Exported {meta['n_docs']} documents, {meta['n_words']} words to {os.path.join(out_path, filename)}")
@@ -1,9 +1,11 @@
 # from sklearn.preprocessing import LabelEncoder
+import argparse
 import os
 import random
 import re
-import sys
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 from typing import List, Tuple
 
 import conllu
@@ -14,16 +16,17 @@ def is_new_doc(sample):
     return "newdoc id" in sample.metadata
 
 
-def get_grouped_docs(data):
-    # a new document will always start with "newdoc id" in the metadata field
-    # group all documents by their id.
-    grouped_docs = defaultdict(list)
-    current_doc = None
-    for sent in data:
-        if is_new_doc(sent):
-            current_doc = sent.metadata["newdoc id"]
-        grouped_docs[current_doc].append(sent)
-    return grouped_docs
+def iter_docs(f):
+    # a new document always starts with "newdoc id" in the metadata field:
+    # yield the sentences of a document as soon as the next one starts
+    doc = []
+    for sent in conllu.parse_incr(f):
+        if is_new_doc(sent) and doc:
+            yield doc
+            doc = []
+        doc.append(sent)
+    if doc:
+        yield doc
 
 
 # Define a regular expression pattern to match CoNLL-style mention annotations
@@ -112,24 +115,6 @@ def compute_chains(columns):
     return list(chains.values())
 
 
-def get_coref_clusters_from_doc(doc):
-    misc = []
-    for s_id, sent in enumerate(doc):
-        sent_misc = []
-        for token in sent:
-            # get misc if it exists:
-            if "misc" in token and token["misc"] is not None:
-                _misc = token["misc"]
-                entity = _misc.get("Entity", None)
-                sent_misc.append(entity)
-            else:
-                sent_misc.append(None)
-        misc.extend(sent_misc)
-
-    chains = compute_chains(misc)  # if you want a spacy-like mapping
-    return chains
-
-
 def get_head(mention: Tuple[int, int], heads: List[int]) -> int:
     """Returns the span's head, which is defined as the only word within the
     span whose head is outside of the span or None. In case there are no or
@@ -173,40 +158,25 @@ def parse_doc(doc, part_id=None):
     """
 
     doc_id = doc[0].metadata["newdoc id"]
-    cased_words = [word["form"] for sent in doc for word in sent]
 
+    # all columns are built in a single pass over the words
+    cased_words = []
     sent_id = []  # create a sentence mapping starting from 0
-    current_sent = 0
-    for sent in doc:
-        sent_id.extend([current_sent] * len(sent))
-        current_sent += 1
-
-    speakers = [0] * len(cased_words)
-
-    pos = [word["upos"] for sent in doc for word in sent]
-    deprel = [word["deprel"] for sent in doc for word in sent]
-    heads = [word["head"] for sent in doc for word in sent]
-    feats = [word["feats"] for sent in doc for word in sent]
-
+    pos = []
+    deprel = []
     heads = []
+    entities = []
+
     # we need to build the proper heads, as they are...
     # 1) indexed on token ID (1-indexed, not 0)
     # 2) grounded per sentence
     token_count = 0
-    missed = 0
-    added_heads = 0
-    added_roots = 0
-
-    # speakers = []
-
-    for sent in doc:
-        # a sentence can have the speaker metadata attribute,
-        # add it for the entire sentence if so
-        # if "sentences" in sent.metadata:
-        #     speakers.extend([sent.metadata["sentences"]["speaker"]] * len(sent))
-        # else:
-        #     speakers.extend([None] * len(sent))
+    for current_sent, sent in enumerate(doc):
         for word in sent:
+            cased_words.append(word["form"])
+            sent_id.append(current_sent)
+            pos.append(word["upos"])
+            deprel.append(word["deprel"])
             # check if this is a root:
             if word["deprel"] == "root":
                 heads.append(None)
@@ -215,16 +185,16 @@ def parse_doc(doc, part_id=None):
                 heads.append(token_count + word_head - 1)
             else:
                 heads.append(None)
+            # get the entity annotation of misc if it exists:
+            if "misc" in word and word["misc"] is not None:
+                entities.append(word["misc"].get("Entity", None))
+            else:
+                entities.append(None)
 
         token_count += len(sent)
 
-    # label encode (None -> 0, "Name" -> 1, "Another name" -> 2, etc.)
-    # le_enc = LabelEncoder()
-    # fit on speakers:
-    # speakers = le_enc.fit_transform(speakers)
-
     # now we need to group all coreference clusters...
-    clusters = get_coref_clusters_from_doc(doc)
+    clusters = compute_chains(entities)
     span_clusters = []
     singletons = []
     for cl in clusters:
@@ -253,20 +223,82 @@ def parse_doc(doc, part_id=None):
 def parse_path(path):
     parsed_docs = []
     with open(path, encoding="utf-8") as f:
-        grouped_docs = get_grouped_docs(conllu.parse(f.read()))
-        for part_id, _doc in enumerate(grouped_docs.values()):
+        for part_id, _doc in enumerate(iter_docs(f)):
             parsed_docs.append(parse_doc(_doc, part_id=part_id))
     return parsed_docs
 
 
+def starts_new_doc(comment_lines):
+    # the raw-text equivalent of is_new_doc, following how conllu reads comments
+    for line in comment_lines:
+        key, _, value = line.strip()[1:].partition("=")
+        if key.strip() == "newdoc id" and value.strip():
+            return True
+    return False
+
+
+def iter_doc_texts(f):
+    # like iter_docs, but yields the unparsed text of every document,
+    # such that it can be sent to a worker process cheaply
+    doc, sent = [], []
+    # a final empty line ends the last sentence
+    for line in chain(f, ["\n"]):
+        if line.strip():
+            sent.append(line if line.endswith("\n") else line + "\n")
+            continue
+        if not sent:
+            continue
+        if starts_new_doc(line for line in sent if line.startswith("#")) and doc:
+            yield "".join(doc)
+            doc = []
+        doc.extend(sent)
+        doc.append("\n")
+        sent = []
+    if doc:
+        yield "".join(doc)
+
+
+def parse_doc_text(part_id, text):
+    return parse_doc(conllu.parse(text), part_id=part_id)
+
+
+def iter_parsed_docs(f, workers=None):
+    """
+    Streams the parsed documents of an open CoNLL-U file, in file order.
+    Documents are parsed in a pool of worker processes (all CPUs by default),
+    with a bounded number of documents in flight, so memory use does not
+    grow with the size of the file.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for part_id, text in enumerate(iter_doc_texts(f)):
+            yield parse_doc_text(part_id, text)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for part_id, text in enumerate(iter_doc_texts(f)):
+            in_flight.append(executor.submit(parse_doc_text, part_id, text))
+            if len(in_flight) >= workers * 4:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
 if __name__ == "__main__":
-    in_path, out_path = sys.argv[1], sys.argv[2]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("in_path", help="CoNLL-U file to convert")
+    parser.add_argument("out_path", help="Folder for the converted .jsonl file")
+    parser.add_argument(
+        "--jobs", "-j", type=int, help="Number of worker processes (default: all CPUs)"
+    )
+    args = parser.parse_args()
+
+    in_path, out_path = args.in_path, args.out_path
     with open(in_path, encoding="utf-8") as f:
-        grouped_docs = get_grouped_docs(conllu.parse(f.read()))
         filename = in_path.split("/")[-1].replace(".conllu", "")
         out_path = os.path.join(out_path, filename + ".jsonl")
 
         with jsonlines.open(out_path, mode="w") as writer:
-            for part_id, _doc in enumerate(grouped_docs.values()):
-                parsed = parse_doc(_doc, part_id=part_id)
+            for parsed in iter_parsed_docs(f, workers=args.jobs):
                 writer.write(parsed)
@@ -1,87 +1,152 @@
-from collections import defaultdict
 import logging
-import os
-from typing import Tuple
+import sys
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
 
 import jsonlines
-import sys
+import numpy as np
 
 
-def get_head(mention: Tuple[int, int], doc: dict) -> int:
-    """Returns the span's head, which is defined as the only word within the
-    span whose head is outside of the span or None. In case there are no or
-    several such words, the rightmost word is returned
+def get_heads(starts: np.ndarray, ends: np.ndarray, word_heads: np.ndarray) -> np.ndarray:
+    """Returns the head of every mention of a document, which is defined as
+    the only word within the span whose head is outside of the span or None.
+    In case there are no or several such words, the rightmost word is returned.
 
     Args:
-        mention (Tuple[int, int]): start and end (exclusive) of a span
-        doc (dict): the document data
+        starts (np.ndarray): start of every mention
+        ends (np.ndarray): end (exclusive) of every mention
+        word_heads (np.ndarray): the head of every word of the document, NaN for None
 
     Returns:
-        int: word id of the spans' head
+        np.ndarray: word id of the head of every mention
     """
-    head_candidates = set()
-    start, end = mention
-    for i in range(start, end):
-        ith_head = doc["head"][i]
-        if ith_head is None or not (start <= ith_head < end):
-            head_candidates.add(i)
-    if len(head_candidates) == 1:
-        return head_candidates.pop()
-    return end - 1
-
-
-if __name__ == "__main__":
-    input_path, output_path = sys.argv[1], sys.argv[2]
-    logging.basicConfig(level=logging.INFO)
-
-    with jsonlines.open(input_path, mode="r") as inf:
-        with jsonlines.open(output_path, mode="a") as outf:
-            deleted_spans = 0
-            deleted_clusters = 0
-            total_spans = 0
-            total_clusters = 0
+    lengths = ends - starts
+    # every word of every mention, as (mention, word) pairs
+    mention_of = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    words = starts[mention_of] + np.arange(len(mention_of)) - offsets[mention_of]
+
+    word_head = word_heads[words]
+    # NaN (None) compares false, and is outside of every span
+    candidate = ~((word_head >= starts[mention_of]) & (word_head < ends[mention_of]))
+    n_candidates = np.bincount(mention_of, weights=candidate, minlength=len(starts))
+    # with a single candidate, the weighted sum is that candidate
+    only_candidate = np.bincount(mention_of, weights=words * candidate, minlength=len(starts))
+    return np.where(n_candidates == 1, only_candidate.astype(np.int64), ends - 1)
+
+
+@dataclass
+class HeadStats:
+    total_spans: int = 0
+    total_clusters: int = 0
+    deleted_spans: int = 0
+    deleted_clusters: int = 0
+
+    def __str__(self):
+        spans_deleted = 0 if self.total_spans == 0 else self.deleted_spans / self.total_spans
+        clusters_deleted = 0 if self.total_clusters == 0 else self.deleted_clusters / self.total_clusters
+        return f"""
+            Deleted:
+                {self.deleted_spans}/{self.total_spans} ({spans_deleted:.2%}) spans
+                {self.deleted_clusters}/{self.total_clusters} ({clusters_deleted:.2%}) clusters
+            """
 
-            for doc in inf:
-                total_spans += sum(len(cluster) for cluster in doc["clusters"])
-                total_clusters += len(doc["clusters"])
 
-                head_clusters = [[get_head(mention, doc) for mention in cluster] for cluster in doc["clusters"]]
+def convert_doc(doc: dict, stats: Optional[HeadStats] = None) -> dict:
+    """Replaces the span clusters of a document (as written by conll_to_jsonl)
+    with clusters of their head words. When several spans share a head, only
+    the shortest of them keeps it (the first one on ties), the head is dropped
+    from the clusters of the others. Clusters left with a single head are dropped.
 
-                head2spans = defaultdict(list)
-                for cluster, head_cluster in zip(doc["clusters"], head_clusters):
-                    for span, span_head in zip(cluster, head_cluster):
-                        head2spans[span_head].append((span, head_cluster))
+    Adds `head2span`, `word_clusters` and `span_clusters` to the document,
+    in place of `clusters`.
 
-                doc["head2span"] = []
+    Returns:
+        dict: the document
+    """
+    clusters = doc["clusters"]
+    stats = stats if stats is not None else HeadStats()
+    n_mentions = sum(len(cluster) for cluster in clusters)
+    stats.total_spans += n_mentions
+    stats.total_clusters += len(clusters)
+
+    spans = np.array([span for cluster in clusters for span in cluster], dtype=np.int64).reshape(-1, 2)
+    cluster_of = np.repeat(np.arange(len(clusters)), [len(cluster) for cluster in clusters])
+    word_heads = np.array(doc["head"], dtype=np.float64)  # None -> NaN
+    starts, ends = spans[:, 0], spans[:, 1]
+    heads = get_heads(starts, ends, word_heads)
+
+    # the spans of every head, shortest first, then in cluster order
+    order = np.lexsort((np.arange(n_mentions), ends - starts, heads))
+    sorted_heads = heads[order]
+    is_first = np.ones(n_mentions, dtype=bool)
+    is_first[1:] = sorted_heads[1:] != sorted_heads[:-1]
+    winners = order[is_first]  # sorted by head
+    unique_heads = heads[winners]
+
+    # the cluster that keeps each head
+    head_index = np.searchsorted(unique_heads, heads)
+    winner_cluster = cluster_of[winners][head_index]
+    # A cluster with several spans of a head keeps at most one of them, the last
+    key = cluster_of * (len(word_heads) + 1) + heads + 1  # heads of empty spans may be -1
+    _, last_reversed = np.unique(key[::-1], return_index=True)
+    is_last = np.zeros(n_mentions, dtype=bool)
+    is_last[n_mentions - 1 - last_reversed] = True
+    keep = is_last & (cluster_of == winner_cluster)
+
+    # head2span follows the order in which the heads first appear
+    _, first_seen = np.unique(heads, return_index=True)
+    by_appearance = winners[np.argsort(first_seen)]
+    doc["head2span"] = list(
+        zip(heads[by_appearance].tolist(), starts[by_appearance].tolist(), ends[by_appearance].tolist())
+    )
+
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for head in unique_heads[np.bincount(head_index, minlength=len(unique_heads)) > 1].tolist():
+            logging.debug(f'{doc["document_id"]} {doc["cased_words"][head]}')
+            for i in order[sorted_heads == head].tolist():
+                logging.debug(f'{cluster_of[i]} {" ".join(doc["cased_words"][starts[i]:ends[i]])}')
+            logging.debug("=====")
+
+    kept_heads = heads[keep].tolist()
+    cluster_ends = np.cumsum(np.bincount(cluster_of[keep], minlength=len(clusters))).tolist()
+    head_clusters = [kept_heads[start:end] for start, end in zip([0] + cluster_ends, cluster_ends)]
+    word_clusters = [cluster for cluster in head_clusters if len(cluster) > 1]
+
+    stats.deleted_spans += n_mentions - int(keep.sum())
+    stats.deleted_clusters += len(clusters) - len(word_clusters)
+    doc["word_clusters"] = word_clusters
+    doc["span_clusters"] = doc["clusters"]
+    del doc["clusters"]
+    return doc
+
+
+def convert_docs(docs: Iterable[dict], stats: Optional[HeadStats] = None) -> Iterator[dict]:
+    """convert_doc for a stream of documents, e.g. those of
+    conll_to_jsonl.iter_parsed_docs, such that no JSONL file is needed in between.
+    """
+    for doc in docs:
+        yield convert_doc(doc, stats)
 
-                for head, spans in head2spans.items():
-                    spans.sort(key=lambda x: x[0][1] - x[0][0])  # shortest spans first
-                    doc["head2span"].append((head, *spans[0][0]))
 
-                    if len(spans) > 1:
-                        logging.debug(f'{doc["document_id"]} {doc["cased_words"][head]}')
-                        for span, cluster in spans:
-                            logging.debug(f'{id(cluster)} {" ".join(doc["cased_words"][slice(*span)])}')
-                        logging.debug("=====")
+def read_docs(input_path: str, jobs: Optional[int] = None) -> Iterator[dict]:
+    # a .conllu file is converted on the fly, anything else is read as JSONL
+    if input_path.endswith(".conllu"):
+        from conll_to_jsonl import iter_parsed_docs
 
-                        for _, cluster in spans[1:]:
-                            cluster.remove(head)
-                            deleted_spans += 1
+        with open(input_path, encoding="utf-8") as f:
+            yield from iter_parsed_docs(f, workers=jobs)
+    else:
+        with jsonlines.open(input_path, mode="r") as inf:
+            yield from inf
 
-                filtered_head_clusters = [cluster for cluster in head_clusters if len(cluster) > 1]
-                deleted_clusters += len(head_clusters) - len(filtered_head_clusters)
-                doc["word_clusters"] = filtered_head_clusters
-                doc["span_clusters"] = doc["clusters"]
-                del doc["clusters"]
 
-                outf.write(doc)
+if __name__ == "__main__":
+    input_path, output_path = sys.argv[1], sys.argv[2]
+    logging.basicConfig(level=logging.INFO)
 
-            spans_deleted = 0 if total_spans == 0 else deleted_spans / total_spans
-            clusters_deleted = 0 if total_clusters == 0 else deleted_clusters / total_clusters
-            print(
-                f"""
-            Deleted:
-                {deleted_spans}/{total_spans} ({spans_deleted:.2%}) spans
-                {deleted_clusters}/{total_clusters} ({clusters_deleted:.2%}) clusters
-            """
-            )
+    stats = HeadStats()
+    with jsonlines.open(output_path, mode="a") as outf:
+        for doc in convert_docs(read_docs(input_path), stats):
+            outf.write(doc)
+    print(stats)
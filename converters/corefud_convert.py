@@ -0,0 +1,130 @@
+import argparse
+import glob
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from typing import List, Optional, Tuple
+
+import jsonlines
+
+from conll_to_jsonl import iter_parsed_docs
+
+# the splits that are converted, as in corefud_convert.sh
+SPLITS = ("train", "dev", "dev.blind", "test.blind")
+
+
+def find_files(data_dir: str) -> List[Tuple[str, str]]:
+    """
+    Returns:
+        List[Tuple[str, str]]: (dataset, path) of every .conllu file to convert,
+            for every dataset folder in data_dir
+    """
+    files = []
+    for dataset in sorted(os.listdir(data_dir)):
+        dataset_dir = os.path.join(data_dir, dataset)
+        if not os.path.isdir(dataset_dir):
+            continue
+        for split in SPLITS:
+            for path in sorted(glob.glob(os.path.join(dataset_dir, f"*-{split}.conllu"))):
+                files.append((dataset, path))
+    return files
+
+
+def output_paths(in_path: str, out_dir: str) -> Tuple[str, str]:
+    """
+    Returns:
+        Tuple[str, str]: the .jsonl and _heads.jsonl files of a .conllu file
+    """
+    base = os.path.basename(in_path).replace(".conllu", "")
+    return os.path.join(out_dir, f"{base}.jsonl"), os.path.join(out_dir, f"{base}_heads.jsonl")
+
+
+def convert_file(in_path: str, out_dir: str, heads: bool = False) -> Tuple[int, int, float]:
+    """
+    Converts a .conllu file to {name}.jsonl in out_dir, and to {name}_heads.jsonl
+    with the head clusters of convert_to_heads if heads is set.
+
+    Returns:
+        Tuple[int, int, float]: the number of documents, words and seconds
+    """
+    start = time.perf_counter()
+    jsonl_path, heads_path = output_paths(in_path, out_dir)
+    n_docs, n_words = 0, 0
+    with ExitStack() as stack:
+        f = stack.enter_context(open(in_path, encoding="utf-8"))
+        writer = stack.enter_context(jsonlines.open(jsonl_path, mode="w"))
+        heads_writer = None
+        if heads:
+            from convert_to_heads import convert_doc
+
+            heads_writer = stack.enter_context(jsonlines.open(heads_path, mode="w"))
+        for doc in iter_parsed_docs(f, workers=1):
+            n_docs += 1
+            n_words += len(doc["cased_words"])
+            writer.write(doc)
+            if heads_writer is not None:
+                heads_writer.write(convert_doc(doc))
+    return n_docs, n_words, time.perf_counter() - start
+
+
+def convert_all(data_dir: str, out_dir: str, heads: bool = False, jobs: Optional[int] = None) -> int:
+    """
+    Converts every split of every dataset in data_dir into out_dir/{dataset},
+    one file per worker process (all CPUs by default). The partial output of
+    a file that fails to convert is removed.
+
+    Returns:
+        int: the number of files that failed to convert
+    """
+    # remove it first
+    shutil.rmtree(out_dir, ignore_errors=True)
+    files = find_files(data_dir)
+    for dataset in {dataset for dataset, _ in files}:
+        os.makedirs(os.path.join(out_dir, dataset), exist_ok=True)
+
+    start = time.perf_counter()
+    total_words, failed = 0, 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # the largest files first, such that no worker is left with one at the end
+        futures = {
+            executor.submit(convert_file, path, os.path.join(out_dir, dataset), heads): (dataset, path)
+            for dataset, path in sorted(files, key=lambda file: os.path.getsize(file[1]), reverse=True)
+        }
+        for future in as_completed(futures):
+            dataset, path = futures[future]
+            name = f"{dataset}/{os.path.basename(path)}"
+            try:
+                n_docs, n_words, seconds = future.result()
+            except Exception as e:
+                print(f"  - Failed to convert {name}: {e!r}")
+                failed += 1
+                for partial in output_paths(path, os.path.join(out_dir, dataset)):
+                    if os.path.exists(partial):
+                        os.remove(partial)
+                continue
+            total_words += n_words
+            rate = n_words / seconds if seconds else 0
+            print(f"  - {name}: {n_docs} documents, {n_words} words in {seconds:.1f}s ({rate:,.0f} words/s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"Converted {len(files) - failed} files, {total_words} words in {elapsed:.1f}s")
+    if failed:
+        print(f"Failed to convert {failed} files")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default="../data", help="Folder with one folder per CorefUD dataset")
+    parser.add_argument("--out-dir", default="../data_jsonl", help="Folder for the converted datasets")
+    parser.add_argument("--heads", action="store_true", help="Also write the {file}_heads.jsonl files")
+    parser.add_argument(
+        "--jobs", "-j", type=int, help="Number of worker processes (default: all CPUs)"
+    )
+    args = parser.parse_args()
+
+    failed = convert_all(args.data_dir, args.out_dir, heads=args.heads, jobs=args.jobs)
+    sys.exit(1 if failed else 0)
@@ -1,11 +1,13 @@
 import argparse
 import os
+import time
 from dataclasses import dataclass
 from enum import Enum
-from typing import List
+from typing import Optional
 
-from conllu import TokenList, parse
-from tqdm import tqdm
+import instrumentation
+from sentence_alignment import align_files
+from util import run_jobs
 
 
 class Language(Enum):
@@ -43,7 +45,7 @@ def get_paths(path: str) -> Paths:
     )
 
 
-def align_norne(norne: str, ud: str, output: str) -> None:
+def align_norne(norne: str, ud: str, output: str, jobs: Optional[int] = None) -> None:
     """
     Aligns the NorNE and UD Norwegian corpora and writes the aligned data to
     CoNLL-U format files.
@@ -52,12 +54,15 @@ def align_norne(norne: str, ud: str, output: str) -> None:
         norne (str): The path to the NorNE corpus directory.
         ud (str): The path to the UD Norwegian corpus directory.
         output (str): The path to the output directory.
+        jobs (int, optional): The number of (language, split) pairs aligned in
+            parallel. All CPUs by default.
 
     Returns:
         None
     """
     os.makedirs(output, exist_ok=True)
 
+    jobs_args = []
     for lang in Language:
         norne_id = "nob" if lang == Language.BOKMAAL else "nno"
         ud_id = f"UD_Norwegian-{lang.value.capitalize()}"
@@ -66,114 +71,26 @@ def align_norne(norne: str, ud: str, output: str) -> None:
         UD = get_paths(os.path.join(ud, ud_id))
 
         for split in ["train", "test", "dev"]:
-            norne_path = getattr(NORNE, split)
-            ud_path = getattr(UD, split)
-            print(split)
-            print(norne_path, ud_path)
-
-            with open(ud_path, "r", encoding="utf-8") as ud_f, open(
-                norne_path, "r", encoding="utf-8"
-            ) as entity_f:
-                ud_data = parse(ud_f.read())
-                entity_data = parse(entity_f.read())
-
             out_filename = f"no_{lang.value}-ud-{split}.conllu"
-            out = os.path.join(output, out_filename)
-
-            aligned_data = align_sentences(ud_data, entity_data)
-
-            with open(out, "w", encoding="utf-8", newline="\n") as f:
-                for sent in aligned_data:
-                    f.write(sent.serialize())
+            jobs_args.append(
+                (split, getattr(NORNE, split), getattr(UD, split), os.path.join(output, out_filename)))
 
+    # the pairs are independent of each other
+    run_jobs(align_split, jobs_args, jobs)
 
-def align_sentences(
-    ud_data: List[TokenList], entity_data: List[TokenList]
-) -> List[TokenList]:
-    """
-    Aligns the sentences in the UD Norwegian and NorNE corpora.
-
-    Args:
-        ud_data (List[TokenList]): The UD Norwegian corpus data.
-        entity_data (List[TokenList]): The NorNE corpus data.
 
-    Returns:
-        List[TokenList]: The aligned data.
+def align_split(split: str, norne_path: str, ud_path: str, out: str) -> None:
     """
-    aligned_data = []
-
-    # some sentences are split across two sentences in the NorNE data
-    # keep track of this index
-    entity_extra_idx_iterator = 0
-
-    for i in tqdm(range(len(ud_data))):
-        ud_sent = ud_data[i]
-        entity_sent = entity_data[i + entity_extra_idx_iterator]
-
-        valid_idx = i + entity_extra_idx_iterator + 1 < len(entity_data)
-        if valid_idx:
-            entity_sent_nxt = entity_data[i + entity_extra_idx_iterator + 1]
-            next_entity_text = entity_sent_nxt.metadata["text"]
-
-        meta = ud_sent.metadata  # we will modify the entire object, so save it
-        ud_text = ud_sent.metadata["text"]
-        entity_text = entity_sent.metadata["text"]
-
-        if ud_text == entity_text:
-            aligned = merge_sentences(ud_sent, entity_sent)
-            ud_data[i] = aligned
-        elif ud_text == entity_text + next_entity_text and valid_idx:
-            # try to match the UD sent with the next NorNE sent
-            # such that UD1 = NorNE1 + NorNE2
-            entity_tokens = [t for t in entity_sent]
-            entity_tokens_nxt = [t for t in entity_sent_nxt]
-            merged = TokenList(entity_tokens + entity_tokens_nxt)
-            aligned = merge_sentences(ud_sent, merged)
-            ud_data[i] = aligned
-            entity_extra_idx_iterator += 1
-        elif ud_text == entity_text[1:]:
-            # we may get:
-            # En kampanje for "etnisk renskning" starter med at én nabo vender seg mot en annen.
-            # "En kampanje for "etnisk renskning" starter med at én nabo vender seg mot en annen.
-            # that is, the norne sentence has an unnecessary token at the beginning. Ignore it!
-            entity_tokens = [t for t in entity_sent]
-            merged = TokenList(entity_tokens[1:])
-            aligned = merge_sentences(ud_sent, merged)
-            ud_data[i] = aligned
-        else:
-            print(f"Mismatched sentences on line {ud_sent.metadata['sent_id']}")
-            print(ud_sent.metadata["text"])
-            print(entity_sent.metadata["text"])
-            print("_" * 40)
-
-        ud_data[i].metadata = meta
-        aligned_data.append(ud_data[i])
-
-    return aligned_data
-
-
-def merge_sentences(ud: TokenList, entity: TokenList) -> TokenList:
+    Aligns a single split of NorNE with its UD split and writes the aligned
+    data to a CoNLL-U format file.
     """
-    Merges the UD Norwegian and NorNE corpus data for a single sentence.
+    print(split)
+    print(norne_path, ud_path)
 
-    Args:
-        ud (TokenList): The UD Norwegian corpus data for the sentence.
-        entity (TokenList): The NorNE corpus data for the sentence.
-
-    Returns:
-        TokenList: The merged data.
-    """
-    ud_toks = [t for t in ud]
-    entity_toks = [t for t in entity]
-    for j, ud_tok in enumerate(ud_toks):
-        ud_misc = ud_tok["misc"] or {}
-        entity_misc = entity_toks[j]["misc"] or {}
-        entity_misc = {k: v for k, v in entity_misc.items() if k == "name"}
-
-        ud_misc.update(entity_misc)
-        ud_tok["misc"] = ud_misc
-
-    return TokenList(ud_toks)
+    start = time.perf_counter()
+    align_files(ud_path, norne_path, out)
+    instrumentation.document(os.path.basename(out), time.perf_counter() - start)
+    instrumentation.count("files")
 
 
 if __name__ == "__main__":
@@ -189,6 +106,9 @@ if __name__ == "__main__":
         help="Merged files location",
         default="data/norne-aligned",
     )
+    parser.add_argument(
+        "--jobs", "-j", type=int, help="Number of splits aligned in parallel (default: all CPUs)"
+    )
     args = parser.parse_args()
 
-    align_norne(args.norne, args.ud, args.output)
+    align_norne(args.norne, args.ud, args.output, jobs=args.jobs)
@@ -1,10 +1,9 @@
 import argparse
 import os
-from typing import List
+from typing import Optional
 
-from conllu import TokenList, parse
-from tqdm import tqdm
-from util import Language, get_paths
+from sentence_alignment import align_files
+from util import Language, get_paths, run_jobs
 
 
 def align_treebank(
@@ -14,6 +13,7 @@ def align_treebank(
     train_key="train",
     test_key="test",
     dev_key="dev",
+    jobs: Optional[int] = None,
 ) -> None:
     """
     Aligns the source + UD and writes the aligned data to CoNLL-U
@@ -25,6 +25,7 @@ def align_treebank(
         train_key (str): The key for the training data.
         test_key (str): The key for the testing data.
         dev_key (str): The key for the development data.
+        jobs (int, optional): The number of splits aligned in parallel. All CPUs by default.
 
     Returns:
         None
@@ -34,113 +35,23 @@ def align_treebank(
     ud = get_paths(ud)
     source = get_paths(source)
 
-    for split in [train_key, test_key, dev_key]:
-        source_path = getattr(source, split)
-        ud_path = getattr(ud, split)
-        print(f"Processing {source_path.split('/')[-1]} and {ud_path.split('/')[-1]}")
+    jobs_args = [
+        (getattr(source, split), getattr(ud, split),
+         os.path.join(output, f"aligned-ud-{split}.conllu"))
+        for split in [train_key, test_key, dev_key]
+    ]
+    # the splits are independent of each other
+    run_jobs(align_split, jobs_args, jobs)
 
-        with open(ud_path, "r", encoding="utf-8") as ud_f, open(
-            source_path, "r", encoding="utf-8"
-        ) as entity_f:
-            ud_data = parse(ud_f.read())
-            entity_data = parse(entity_f.read())
 
-        out_filename = f"aligned-ud-{split}.conllu"
-        out = os.path.join(output, out_filename)
-
-        aligned_data = align_sentences(ud_data, entity_data)
-
-        with open(out, "w", encoding="utf-8", newline="\n") as f:
-            for sent in aligned_data:
-                f.write(sent.serialize())
-
-
-def align_sentences(
-    ud_data: List[TokenList], entity_data: List[TokenList]
-) -> List[TokenList]:
+def align_split(source_path: str, ud_path: str, out: str) -> None:
     """
-    Aligns the sentences in the UD and source corpora.
-
-    Args:
-        ud_data (List[TokenList]): The UD corpus.
-        entity_data (List[TokenList]): The source data.
-
-    Returns:
-        List[TokenList]: The aligned data.
+    Aligns a single source split with its UD split and writes the aligned
+    data to CoNLL-U
     """
-    aligned_data = []
-
-    # some sentences are split across two sentences in the source data
-    # keep track of this index
-    entity_extra_idx_iterator = 0
-
-    for i in tqdm(range(len(ud_data))):
-        ud_sent = ud_data[i]
-        entity_sent = entity_data[i + entity_extra_idx_iterator]
-
-        valid_idx = i + entity_extra_idx_iterator + 1 < len(entity_data)
-        if valid_idx:
-            entity_sent_nxt = entity_data[i + entity_extra_idx_iterator + 1]
-            next_entity_text = entity_sent_nxt.metadata["text"]
-
-        meta = ud_sent.metadata  # we will modify the entire object, so save it
-        ud_text = ud_sent.metadata["text"]
-        entity_text = entity_sent.metadata["text"]
-
-        if ud_text == entity_text:
-            aligned = merge_sentences(ud_sent, entity_sent)
-            ud_data[i] = aligned
-        elif ud_text == entity_text + next_entity_text and valid_idx:
-            # try to match the UD sent with the next source sent
-            # such that UD1 = source1 + source2
-            entity_tokens = [t for t in entity_sent]
-            entity_tokens_nxt = [t for t in entity_sent_nxt]
-            merged = TokenList(entity_tokens + entity_tokens_nxt)
-            aligned = merge_sentences(ud_sent, merged)
-            ud_data[i] = aligned
-            entity_extra_idx_iterator += 1
-        elif ud_text == entity_text[1:]:
-            # we may get:
-            # En kampanje for "etnisk renskning" starter med at én nabo vender seg mot en annen.
-            # "En kampanje for "etnisk renskning" starter med at én nabo vender seg mot en annen.
-            # that is, the source sentence has an unnecessary token at the beginning. Ignore it!
-            entity_tokens = [t for t in entity_sent]
-            merged = TokenList(entity_tokens[1:])
-            aligned = merge_sentences(ud_sent, merged)
-            ud_data[i] = aligned
-        else:
-            print(f"Mismatched sentences on line {ud_sent.metadata['sent_id']}")
-            print(ud_sent.metadata["text"])
-            print(entity_sent.metadata["text"])
-            print("_" * 40)
+    print(f"Processing {source_path.split('/')[-1]} and {ud_path.split('/')[-1]}")
 
-        ud_data[i].metadata = meta
-        aligned_data.append(ud_data[i])
-
-    return aligned_data
-
-
-def merge_sentences(ud: TokenList, entity: TokenList) -> TokenList:
-    """
-    Merges UD and source corpus data for a single sentence.
-
-    Args:
-        ud (TokenList): The UD Norwegian corpus data for the sentence.
-        entity (TokenList): The source corpus data for the sentence.
-
-    Returns:
-        TokenList: The merged data.
-    """
-    ud_toks = [t for t in ud]
-    entity_toks = [t for t in entity]
-    for j, ud_tok in enumerate(ud_toks):
-        ud_misc = ud_tok["misc"] or {}
-        entity_misc = entity_toks[j]["misc"] or {}
-        entity_misc = {k: v for k, v in entity_misc.items() if k == "name"}
-        ud_misc.update(entity_misc)
-        ud_tok["misc"] = ud_misc
-
-    return TokenList(ud_toks)
+    align_files(ud_path, source_path, out)
 
 
 if __name__ == "__main__":
@@ -156,6 +67,9 @@ if __name__ == "__main__":
         help="Merged files location",
         default="data/source-aligned",
     )
+    parser.add_argument(
+        "--jobs", "-j", type=int, help="Number of splits aligned in parallel (default: all CPUs)"
+    )
     args = parser.parse_args()
 
-    align_treebank(args.source, args.ud, args.output)
+    align_treebank(args.source, args.ud, args.output, jobs=args.jobs)
@@ -1,3 +1,34 @@
-from alignment.build_ud_narc_map import *
-from alignment.merge_ud_narc import *
-from alignment.combine_splits import *
+import importlib
+
+# submodules are only imported once one of their names is used, so that
+# importing the package does not pull in numpy, scipy or conllu
+_EXPORTS = {
+    "build_map": "alignment.build_ud_narc_map",
+    "ResolutionLimits": "alignment.disambiguation",
+    "UDIndex": "alignment.ud_index",
+    "load_split_docs": "alignment.merge_ud_narc",
+    "load_split2doc2sentids": "alignment.merge_ud_narc",
+    "load_narc_connlu": "alignment.merge_ud_narc",
+    "load_narc_doc": "alignment.merge_ud_narc",
+    "align_tokens": "alignment.merge_ud_narc",
+    "merge_conllus": "alignment.merge_ud_narc",
+    "merge_document": "alignment.merge_ud_narc",
+    "merge": "alignment.merge_ud_narc",
+    "SPLITS": "alignment.combine_splits",
+    "get_combined_paths": "alignment.combine_splits",
+    "combine_into_splits": "alignment.combine_splits",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
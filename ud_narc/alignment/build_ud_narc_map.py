@@ -1,41 +1,30 @@
 import json
 import os
 from collections import defaultdict
-from typing import DefaultDict, Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
-from conllu.models import SentenceList
-from scipy.optimize import linear_sum_assignment
-from tqdm import tqdm
+import diagnostics
+import instrumentation
+from alignment.disambiguation import ResolutionLimits, resolve_ambiguous
+from alignment.ud_index import UDIndex
+from alignment.utils_merge import SentIdIndex, normalization_cache_info, preprocess_text
 
-from alignment.utils_merge import build_cost_matrix, preprocess_text
 
-
-def build_map(ud_splits: Optional[Dict[str, SentenceList]] = None,
+def build_map(ud_index: Optional[UDIndex] = None,
               narc_folder: str = "annotations_bokmaal",
               ud_split_folder: str = "UD_SPLITS",
               doc2sent_folder: str = "UD_SPLITS_DOC2SENT",
-              lang: str = "bokmaal",  # used to store language-specific files
+              limits: Optional[ResolutionLimits] = None,
               ):
-    if not ud_splits:
-        raise ValueError("UD splits must be provided!")
+    if not ud_index:
+        raise ValueError("UD index must be provided!")
     print(f"Building mapping between NARC and UD...")
 
-    # STEP 1: load UD sentences
-    # create a sentence-to-sentID map (sent2udsentid)
-    # create a sentID-to-split map (udsentid2split)
-    sentid2origsent: Dict[str, str] = {}
-    sent2udsentid: DefaultDict[str, List[str]] = defaultdict(list)
-    udsentid2split: Dict[str, str] = {}
-    for ud_split, ud_data in ud_splits.items():
-        print(f"Processing {ud_split} split...")
-        for sent_obj in tqdm(ud_data):
-            tokens = [t["form"] for t in sent_obj]
-            origsent = " ".join(tokens)
-            sent = preprocess_text(origsent)
-            sent_id = sent_obj.metadata['sent_id']
-            sent2udsentid[sent].append(sent_id)
-            udsentid2split[sent_id] = ud_split
-            sentid2origsent[sent_id] = origsent
+    # STEP 1: UD sentences are looked up in the UD index
+    # a sentence-to-sentID map (sent2udsentid)
+    # a sentID-to-split map (udsentid2split)
+    sent2udsentid = ud_index.sent2udsentid
+    udsentid2split = ud_index.udsentid2split
 
     # STEP 2: load all NARC sentences
     # create a map from sentence to positions in NARC documents (sent2doc_ord)
@@ -62,6 +51,9 @@ def build_map(ud_splits: Optional[Dict[str, SentenceList]] = None,
             doc2sents[doc_id] = doc_sents
             doc2orisents[doc_id] = doc_origsents
 
+    instrumentation.count("documents", len(doc2sents))
+    instrumentation.count("sentences", sum(len(sents) for sents in doc2sents.values()))
+
     # STEP 3: make the easy-first mapping of NARC sents positions to UD sent IDs (doc2sentids)
     # map only if there is a single UD sent ID available
     # if there is no, the whole document must be excluded
@@ -77,88 +69,72 @@ def build_map(ud_splits: Optional[Dict[str, SentenceList]] = None,
         for i, s in enumerate(sents):
             sentids = sent2udsentid[s]
             if not sentids:
-                print(
-                    f"[WARN] Document {doc} excluded as there is no parse for its {i+1}th sentence: {sents[i]}")
-                excluded_docs_with_no_sent.append((doc, i+1, sents[i]))
+                diagnostics.report(
+                    "no_sentence_match",
+                    "Document {doc} excluded as there is no parse for its {sentence}th sentence: {text}",
+                    doc=doc, sentence=i+1, text=s)
+                excluded_docs_with_no_sent.append((doc, i+1, s))
                 break
             elif len(sentids) == 1:
-                # print(f"[INFO] {doc}:{i+1} aligned to {sentids[0]}.")
                 doc_sentids.append(sentids[0])
             else:
-                print(f"[INFO] Multiple alignments possible for {doc}:{i+1}.")
+                diagnostics.report("multiple_sentence_match", "Multiple alignments possible for {doc}:{sentence}.",
+                                   level="info", doc=doc, sentence=i+1, text=s)
                 doc_sentids.append(None)
                 sents_multiple.add(s)
                 multiple_doc_candidates.append((doc, i+1, s))
         else:
             doc2sentids[doc] = doc_sentids
 
-    with open(f"output/ERROR_NO_SENT_MATCH_{lang}.txt", "w", encoding="utf-8") as f:
-        f.writelines("\n".join(
-            [f"{doc},{sentord},{sent}" for doc, sentord, sent in excluded_docs_with_no_sent]))
-    with open(f"output/ERROR_MULTIPLE_SENT_MATCH_{lang}.txt", "w", encoding="utf-8") as f:
-        f.writelines("\n".join(
-            [f"{doc},{sentord},{sent}" for doc, sentord, sent in multiple_doc_candidates]))
+    instrumentation.count("excluded_documents", len(excluded_docs_with_no_sent))
+    instrumentation.count("ambiguous_sentences", len(multiple_doc_candidates))
 
     # STEP 4: disambiguate NARC sents aligned to multiple UD candidates
     # each UD candidate must be used at most once, minimizing distance of its sentid from neighboring sentids
+    # ambiguous sents sharing neighbors are resolved together, in a deterministic order
     # in the end, none of the sent lists in doc2sentids must contain a None value
-    non_equal_sents = []
-
-    for sent in sents_multiple:
-        narc_ids = sent2doc_ord[sent]
-        ud_ids = sent2udsentid[sent]
-        m = build_cost_matrix(narc_ids, ud_ids, doc2sentids)
-        rows, cols = linear_sum_assignment(m)
-        # print(m)
-        for k in range(len(rows)):
-            doc, sentord = narc_ids[rows[k]]
-            sentid = ud_ids[cols[k]]
-            doc2sentids[doc][sentord] = sentid
-            print(
-                f"[INFO] After disambig {doc}:{sentord+1} aligned to {sentid} with score = {m[rows[k]][cols[k]]}.")
-            narc_origsent = doc2orisents[doc][sentord]
-            ud_origsent = sentid2origsent[sentid]
-            if narc_origsent != ud_origsent:
-                print(f"[WARN] Aligned origsents are not equal")
-                print("[INFO] NARC original:", narc_origsent)
-                print("[INFO] UD   original:", ud_origsent)
-                non_equal_sents.append(
-                    (doc, sentord, sentid, narc_origsent, ud_origsent))
+    doc2index = {doc: SentIdIndex(sentids) for doc, sentids in doc2sentids.items()}
+
+    assignments = resolve_ambiguous(sents_multiple, sent2doc_ord, sent2udsentid, doc2index, limits)
+    # only the UD sentences of disambiguated NARC sentences are read from disk
+    sentid2ud = ud_index.read_sentences(sentid for _, _, sentid, _ in assignments)
+    for doc, sentord, sentid, score in assignments:
+        diagnostics.report("disambiguated_sentence",
+                           "After disambig {doc}:{sentence} aligned to {sentid} with score = {score}.",
+                           level="info", doc=doc, sentence=sentord+1, sentid=sentid, score=float(score))
+        narc_origsent = doc2orisents[doc][sentord]
+        ud_origsent = " ".join(t["form"] for t in sentid2ud[sentid])
+        if narc_origsent != ud_origsent:
+            diagnostics.report("non_equal_sentences",
+                               "Aligned origsents are not equal\nNARC original: {narc}\nUD   original: {ud}",
+                               doc=doc, sentence=sentord+1, sentid=sentid, narc=narc_origsent, ud=ud_origsent)
     for doc, sentids in doc2sentids.items():
         for i, sentid in enumerate(sentids):
             assert sentid is not None, "[ERR] Document {doc} contains None at position {i}."
 
-    with open(f"output/ERROR_NON_EQUAL_SENTS_{lang}.txt", "w", encoding="utf-8") as f:
-        f.write("\n".join([f"{doc},{sentord},{sentid},{narc_origsent},{ud_origsent}" for doc,
-                sentord, sentid, narc_origsent, ud_origsent in non_equal_sents]))
-
     # STEP 5: checking consistency of documents across splits
     # documents that belong to multiple splits must be deleted
     # creating a doc-to-split mapping
-    belongs_to_multiple_splits = []
-
+    n_multiple_splits = 0
     doc2split: Dict[str, str] = {}
     for doc, sentids in list(doc2sentids.items()):
         doc_splits = [udsentid2split[sentid] for sentid in sentids]
         uniq_splits = list(set(doc_splits))
         if len(uniq_splits) > 1:
-            print(
-                f"[WARN] Document {doc} must be removed as it belongs to multiple splits: {' '.join(uniq_splits)}")
             # mapping between sentence and its split
             sentence_to_split = {
                 sent: udsentid2split[sentid] for sent, sentid in zip(doc2sents[doc], sentids)}
-            belongs_to_multiple_splits.append(
-                (doc, uniq_splits, sentence_to_split))
+            diagnostics.report("multiple_ud_splits",
+                               "Document {doc} must be removed as it belongs to multiple splits: {splits}",
+                               doc=doc, splits=sorted(uniq_splits), sentence_to_split=sentence_to_split)
+            n_multiple_splits += 1
             del doc2sentids[doc]
         else:
             doc2split[doc] = uniq_splits[0]
-
-    with open(f"output/ERROR_MULTIPLE_UD_SPLIT_{lang}.txt", "w", encoding="utf-8", newline="\n") as f:
-        f.writelines("\n".join(f"{doc},{uniq_splits},{splitsents}" for doc,
-                     uniq_splits, splitsents in belongs_to_multiple_splits))
+    instrumentation.count("excluded_documents", n_multiple_splits)
 
     # STEP 6: write the split docs to a file
-    for ud_split in ud_splits:
+    for ud_split in ud_index.splits:
         split_folder = os.path.join(os.getcwd(), doc2sent_folder)
         os.makedirs(split_folder, exist_ok=True)
         filename = f"{ud_split}.json"
@@ -177,3 +153,5 @@ def build_map(ud_splits: Optional[Dict[str, SentenceList]] = None,
         with open(filepath, "w", encoding="utf-8", newline="\n") as f:
             # write all doc2sent keys with newlines between them
             f.write("\n".join(split_doc2sentids.keys()))
+
+    print(f"[INFO] Text normalization: {normalization_cache_info()}")
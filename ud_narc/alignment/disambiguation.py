@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import diagnostics
+import instrumentation
+from alignment.utils_merge import SentIdIndex, build_cost_matrix
+
+NarcId = Tuple[str, int]  # (document, sentence position)
+Assignment = Tuple[str, int, str, float]  # (document, sentence position, UD sent ID, score)
+
+
+@dataclass
+class ResolutionLimits:
+    """
+    Limits for a single disambiguation run.
+
+    Args:
+        max_cells (int): largest cost matrix solved optimally. The positions of
+            a sentence text with a bigger one are resolved greedily instead,
+            which only depends on the matrix, so the result stays reproducible.
+    """
+
+    max_cells: int = 4_000_000
+
+
+def _solve(m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if m.shape[0] == 1:
+        # a single NARC sentence simply takes its cheapest candidate
+        return np.zeros(1, dtype=np.int64), np.argmin(m, axis=1)
+    # scipy.optimize takes several hundred milliseconds to import
+    from scipy.optimize import linear_sum_assignment
+
+    instrumentation.count("hungarian_solves")
+    return linear_sum_assignment(m)
+
+
+def _solve_greedy(m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    instrumentation.count("greedy_solves")
+    rows, cols = [], []
+    used = np.zeros(m.shape[1], dtype=bool)
+    for i in range(m.shape[0]):
+        costs = np.where(used, np.inf, m[i])
+        j = int(np.argmin(costs))
+        if np.isinf(costs[j]):
+            break
+        used[j] = True
+        rows.append(i)
+        cols.append(j)
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+
+def resolve_sentence(
+    sent: str,
+    sent2doc_ord: Dict[str, List[NarcId]],
+    sent2udsentid: Dict[str, List[str]],
+    doc2index: Dict[str, SentIdIndex],
+    solver=_solve,
+) -> List[Assignment]:
+    """
+    Assigns the UD candidates of a sentence text to its NARC positions in one
+    assignment problem.
+    """
+    narc_ids = [(doc, sentord) for doc, sentord in sent2doc_ord[sent] if doc in doc2index]
+    ud_ids = sent2udsentid[sent]
+    if not narc_ids:
+        return []
+    m = build_cost_matrix(narc_ids, ud_ids, doc2index)
+    rows, cols = solver(m)
+    return [(*narc_ids[r], ud_ids[c], m[r, c]) for r, c in zip(rows, cols)]
+
+
+def resolve_ambiguous(
+    sents: Iterable[str],
+    sent2doc_ord: Dict[str, List[NarcId]],
+    sent2udsentid: Dict[str, List[str]],
+    doc2index: Dict[str, SentIdIndex],
+    limits: Optional[ResolutionLimits] = None,
+) -> List[Assignment]:
+    """
+    Resolves NARC sentences with multiple UD candidates, such that every UD
+    candidate is used at most once and lies as close as possible to the UD
+    sentences of the resolved neighbours.
+
+    The candidates of a sentence text belong to that text only, and every text
+    is scored against the sentences resolved before this run, as the
+    assignments are only applied at the end. The texts are thus independent,
+    and each is solved on its own, in sorted order.
+
+    Returns:
+        List[Assignment]: the assignments, in the order of their sentence texts.
+            They are also written to doc2index.
+    """
+    limits = limits or ResolutionLimits()
+    assignments: List[Assignment] = []
+    for sent in sorted(sents):
+        n_cells = len(sent2doc_ord[sent]) * len(sent2udsentid[sent])
+        solver = _solve
+        if n_cells > limits.max_cells:
+            diagnostics.report("greedy_resolution",
+                               "{positions} positions of {text!r} resolved greedily, "
+                               "their cost matrix has {cells} cells.",
+                               level="info", text=sent, positions=len(sent2doc_ord[sent]), cells=n_cells)
+            solver = _solve_greedy
+        assignments.extend(resolve_sentence(sent, sent2doc_ord, sent2udsentid, doc2index, solver=solver))
+
+    for doc, sentord, sentid, _ in assignments:
+        doc2index[doc].assign(sentord, sentid)
+    return assignments
@@ -1,10 +1,16 @@
 import json
 import os
+import time
+from contextlib import nullcontext
 
-from conllu import parse
 from tqdm import tqdm
 
-from alignment import preprocess_text
+import instrumentation
+from alignment.utils_merge import normalization_cache_info, preprocess_text
+from split_index import index_path
+from stage_cache import input_digest
+from util import read_sentences
+from writers import SplitWriter, join_document, write_document
 
 
 def load_split_docs(split_folder):
@@ -38,11 +44,14 @@ def load_narc_connlu(narc_conll, built_docs):
         doc_id = file.split(".")[0]
         if doc_id not in built_docs:
             continue
-        data = parse(open(os.path.join(narc_conll, file), "r",
-                     encoding="utf-8", newline="\n").read())
-        doc2conllu[doc_id] = data
+        doc2conllu[doc_id] = load_narc_doc(narc_conll, doc_id)
     return doc2conllu
 
+
+def load_narc_doc(narc_conll, doc_id):
+    with open(os.path.join(narc_conll, f"{doc_id}.conllu"), "r", encoding="utf-8", newline="\n") as f:
+        return list(read_sentences(f))
+
 # align preprocessed NARC tokens to UD tokens
 # the concatenated tokens are guaranteed to agree
 
@@ -93,44 +102,119 @@ def merge_conllus(narc_conllu, ud_conllu):
     return ud_conllu
 
 
+def merge_document(doc, sentids, narc_conll, sentid2ud):
+    """
+    Merges the NARC annotations of a document into its aligned UD sentences.
+
+    Returns:
+        List[str]: the serialized pieces of the merged document
+    """
+    pieces = [f"# newdoc id = {doc}\n", "# global.Entity = eid-etype-head-other\n"]
+
+    narc_conllus = load_narc_doc(narc_conll, doc)
+    assert len(narc_conllus) == len(sentids)
+    for sentid, narc_conllu in zip(sentids, narc_conllus):
+        ud_conllu = sentid2ud[sentid]
+        merge_conllus(narc_conllu, ud_conllu)
+        pieces.append(ud_conllu.serialize())
+    return pieces
+
+
 def merge(
-    ud_splits=None,
+    ud_index=None,
     narc_conll="annotations_conll",
     merged_narc_ud="UD_NARC_MERGED",
     ud_split_folder="UD_SPLITS",
     doc2sent_folder="UD_SPLITS_DOC2SENT",
+    cache=None,
+    combined_files=None,
 ):
-    if not ud_splits:
-        raise ValueError("UD splits must be provided!")
+    """
+    Merges every NARC document with its aligned UD sentences, writing one
+    .conllu file per document into the split folders of merged_narc_ud.
+
+    Args:
+        combined_files (Dict[str, str], optional): the combined file of each
+            split (see get_combined_paths). If given, the documents of a split
+            are also streamed into its combined file while merging, in the
+            order of combine_into_splits, which then need not be run.
+    """
+    if not ud_index:
+        raise ValueError("UD index must be provided!")
 
     print("Merging compatible UD and NARC files...")
 
-    doc2split = load_split_docs(ud_split_folder)
     split2doc2sentids = load_split2doc2sentids(doc2sent_folder)
-    doc2conllu = load_narc_connlu(narc_conll, doc2split.keys())
 
     os.makedirs(merged_narc_ud, exist_ok=True)
+    stage = f"merge_{os.path.basename(os.path.normpath(merged_narc_ud))}"
 
     for split, doc2sentids in split2doc2sentids.items():
         print(f"============ Merging {split} ==============")
 
-        sentid2ud = {s.metadata['sent_id']: s for s in ud_splits[split]}
-
         save_folder = os.path.join(merged_narc_ud, split)
         os.makedirs(save_folder, exist_ok=True)
 
-        for doc, sentids in doc2sentids.items():
-            # print(f"[INFO] Processing document {doc}")
-
-            conll_str = f"# newdoc id = {doc}\n"
-            conll_str += "# global.Entity = eid-etype-head-other\n"
-
-            narc_conllus = doc2conllu[doc]
-            assert len(narc_conllus) == len(sentids)
-            for i, (sentid, narc_conllu) in enumerate(zip(sentids, narc_conllus)):
-                ud_conllu = sentid2ud[sentid]
-                merged_conllu = merge_conllus(narc_conllu, ud_conllu)
-                conll_str += ud_conllu.serialize()
+        # remove documents merged in earlier runs that no longer belong to this split
+        removed = False
+        for file in os.listdir(save_folder):
+            if file.endswith(".conllu") and file[:-len(".conllu")] not in doc2sentids:
+                os.remove(os.path.join(save_folder, file))
+                removed = True
+
+        doc2digest = {}
+        stale = set(doc2sentids)
+        if cache is not None:
+            # a document is only merged again if its NARC conllu, its sentence
+            # alignment or the UD split changed since the last run
+            ud_digest = ud_index.split_digest(split)
+            for doc, sentids in doc2sentids.items():
+                digest = input_digest([os.path.join(narc_conll, f"{doc}.conllu")],
+                                      ud_digest, split, json.dumps(sentids))
+                out_file = os.path.join(save_folder, f"{doc}.conllu")
+                if not cache.is_fresh(stage, doc, digest, outputs=[out_file]):
+                    doc2digest[doc] = digest
+            print(f"{len(doc2sentids) - len(doc2digest)}/{len(doc2sentids)} documents are up to date")
+            stale = set(doc2digest)
+
+        combined_file = combined_files.get(split) if combined_files else None
+        if combined_file and (stale or removed or not all(
+                os.path.exists(path) for path in [combined_file, index_path(combined_file)])):
+            # the combined file holds every document of the split, in file name order
+            docs = sorted(doc2sentids, key=lambda doc: f"{doc}.conllu")
+            split_writer = SplitWriter(combined_file)
+        elif stale:
+            docs = [doc for doc in doc2sentids if doc in stale]
+            split_writer = nullcontext()
+        else:
+            continue
 
-            with open(os.path.join(save_folder, f"{doc}.conllu"), "w", encoding="utf-8", newline="\n") as parsed_file:
-                parsed_file.write(conll_str)
+        # only read the UD sentences that are aligned to a NARC document
+        sentid2ud = ud_index.read_sentences(
+            sentid for doc in stale for sentid in doc2sentids[doc])
+
+        with split_writer:
+            for doc in docs:
+                out_file = os.path.join(save_folder, f"{doc}.conllu")
+                if doc not in stale:
+                    split_writer.copy_document(out_file)
+                    instrumentation.count("copied_documents")
+                    continue
+
+                start = time.perf_counter()
+                sentids = doc2sentids[doc]
+                document = join_document(merge_document(doc, sentids, narc_conll, sentid2ud))
+                write_document(out_file, document)
+                if combined_file:
+                    split_writer.write_document(document)
+                instrumentation.document(doc, time.perf_counter() - start)
+                instrumentation.count("documents")
+                instrumentation.count("sentences", len(sentids))
+                instrumentation.count("tokens", sum(len(sentid2ud[sentid]) for sentid in sentids))
+                if cache is not None:
+                    cache.update(stage, doc, doc2digest[doc])
+
+    if cache is not None:
+        cache.save()
+
+    print(f"[INFO] Text normalization: {normalization_cache_info()}")
@@ -0,0 +1,145 @@
+import os
+import pickle
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from conllu import parse
+from conllu.models import TokenList
+
+from alignment.utils_merge import preprocess_text
+from stage_cache import input_digest
+
+
+def _scan_conllu(path: str):
+    # read sentence IDs, forms and byte offsets straight from the lines,
+    # without parsing the sentences into TokenLists
+    sentids: List[str] = []
+    origsents: List[str] = []
+    offsets = array("q")
+
+    start: Optional[int] = None
+    sent_id: Optional[str] = None
+    forms: List[str] = []
+
+    def finish_sentence():
+        if sent_id is None:
+            raise ValueError(f"Sentence at byte {start} of {path} has no sent_id")
+        sentids.append(sent_id)
+        origsents.append(" ".join(forms))
+        offsets.append(start)
+
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                if start is not None:
+                    finish_sentence()
+                start, sent_id, forms = None, None, []
+            else:
+                if start is None:
+                    start = offset
+                if line.startswith(b"#"):
+                    key, _, value = line[1:].decode("utf-8").partition("=")
+                    if key.strip() == "sent_id":
+                        sent_id = value.strip()
+                else:
+                    forms.append(line.split(b"\t", 2)[1].decode("utf-8"))
+            offset += len(line)
+    if start is not None:
+        finish_sentence()
+    return sentids, origsents, offsets
+
+
+class UDIndex:
+    """
+    An index of the sentences in the UD splits of a treebank, mapping
+    normalized sentence texts to sent IDs, and sent IDs to their split and
+    byte offset in the split's .conllu file. Sentences are only parsed when
+    they are read through the index.
+
+    The index is saved as a pickle next to the pipeline output, and rebuilt
+    when the content of any split file changes.
+    """
+
+    def __init__(self, split2path: Dict[str, str], digest: str, split_data: Dict[str, dict]):
+        self.split2path = split2path
+        self.digest = digest
+        # per split: its file digest, sent IDs, normalized texts and byte offsets, in file order
+        self.split_data = split_data
+
+        self.sent2udsentid: Dict[str, List[str]] = defaultdict(list)
+        self.udsentid2split: Dict[str, str] = {}
+        self.udsentid2offset: Dict[str, int] = {}
+        for split, data in split_data.items():
+            for sentid, text, offset in zip(data["sentids"], data["texts"], data["offsets"]):
+                self.sent2udsentid[text].append(sentid)
+                self.udsentid2split[sentid] = split
+                self.udsentid2offset[sentid] = offset
+
+    @property
+    def splits(self) -> List[str]:
+        return list(self.split2path)
+
+    def split_digest(self, split: str) -> str:
+        return self.split_data[split]["digest"]
+
+    @classmethod
+    def build(cls, split2path: Dict[str, str]) -> "UDIndex":
+        split_data = {}
+        for split, path in split2path.items():
+            print(f"Indexing {split} split: {path}")
+            sentids, origsents, offsets = _scan_conllu(path)
+            split_data[split] = {
+                "digest": input_digest([path]),
+                "sentids": sentids,
+                "texts": [preprocess_text(origsent) for origsent in origsents],
+                "offsets": offsets,
+            }
+        return cls(split2path, input_digest(split2path.values(), *split2path), split_data)
+
+    @classmethod
+    def load_or_build(cls, split2path: Dict[str, str], index_path: str) -> "UDIndex":
+        digest = input_digest(split2path.values(), *split2path)
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                stored = pickle.load(f)
+            if stored["digest"] == digest:
+                return cls(split2path, digest, stored["splits"])
+        index = cls.build(split2path)
+        index.save(index_path)
+        return index
+
+    def save(self, index_path: str) -> None:
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        with open(index_path, "wb") as f:
+            pickle.dump({"digest": self.digest, "splits": self.split_data},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def read_sentences(self, sentids: Iterable[str]) -> Dict[str, TokenList]:
+        """
+        Parses the given sentences only, seeking to each of them in their split file.
+
+        Returns:
+            Dict[str, TokenList]: the parsed sentences by sent ID
+        """
+        split2sentids = defaultdict(list)
+        for sentid in sentids:
+            split2sentids[self.udsentid2split[sentid]].append(sentid)
+
+        sentences = {}
+        for split, split_sentids in split2sentids.items():
+            split_sentids.sort(key=self.udsentid2offset.get)
+            with open(self.split2path[split], "rb") as f:
+                for sentid in split_sentids:
+                    f.seek(self.udsentid2offset[sentid])
+                    lines = []
+                    for line in f:
+                        if not line.strip():
+                            break
+                        lines.append(line)
+                    sentences[sentid] = parse(b"".join(lines).decode("utf-8"))[0]
+        return sentences
+
+    def read_sentence(self, sentid: str) -> TokenList:
+        return self.read_sentences([sentid])[sentid]
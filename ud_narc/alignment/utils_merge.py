@@ -1,52 +1,95 @@
 import re
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
-from numpy import zeros
+import numpy as np
 
 
-def sent_to_UD_dist_score(narcid: Tuple[str, int], udid: str, doc2sentids: Dict[str, List[str]]) -> int:
-    doc, sentord = narcid
-    score = 0
+class SentIdIndex:
+    """
+    The UD sentence IDs of one NARC document (None where still ambiguous),
+    with a sorted list of the resolved positions, so the closest resolved
+    neighbour on each side is found with bisect instead of a linear scan.
+    """
 
-    prev_udid = _get_prev_udid(doc, sentord, doc2sentids)
-    if prev_udid:
-        score += 100 * abs(int(udid) - int(prev_udid) - 1)
-        score += 10 * (int(udid) <= int(prev_udid))
+    def __init__(self, sentids: List[Optional[str]]):
+        self.sentids = sentids  # shared with doc2sentids, updated by assign
+        self.resolved = [i for i, sentid in enumerate(sentids) if sentid is not None]
 
-    next_udid = _get_next_udid(doc, sentord, doc2sentids)
-    if next_udid:
-        score += 100 * abs(int(next_udid) - int(udid) - 1)
-        score += 10 * (int(udid) >= int(next_udid))
+    def prev_pos(self, sentord: int) -> Optional[int]:
+        k = bisect_left(self.resolved, sentord)
+        return self.resolved[k - 1] if k > 0 else None
 
-    return score
+    def next_pos(self, sentord: int) -> Optional[int]:
+        k = bisect_right(self.resolved, sentord)
+        return self.resolved[k] if k < len(self.resolved) else None
 
+    def prev_udid(self, sentord: int) -> Optional[str]:
+        pos = self.prev_pos(sentord)
+        return None if pos is None else self.sentids[pos]
 
-def _get_prev_udid(doc: str, sentord: int, doc2sentids: Dict[str, List[str]]) -> Optional[str]:
-    offset = 1
-    while sentord - offset >= 0 and doc2sentids[doc][sentord - offset] is None:
-        offset += 1
-    if sentord - offset >= 0:
-        return doc2sentids[doc][sentord - offset]
+    def next_udid(self, sentord: int) -> Optional[str]:
+        pos = self.next_pos(sentord)
+        return None if pos is None else self.sentids[pos]
 
+    def assign(self, sentord: int, sentid: str) -> None:
+        if self.sentids[sentord] is None:
+            insort(self.resolved, sentord)
+        self.sentids[sentord] = sentid
 
-def _get_next_udid(doc: str, sentord: int, doc2sentids: Dict[str, List[str]]) -> Optional[str]:
-    offset = 1
-    while sentord + offset < len(doc2sentids[doc]) and doc2sentids[doc][sentord + offset] is None:
-        offset += 1
-    if sentord + offset < len(doc2sentids[doc]):
-        return doc2sentids[doc][sentord + offset]
 
+# runs of disallowed characters become a single space, the spaces are collapsed afterwards
+_DISALLOWED_CHARS = re.compile(r"[^a-zæøåA-ZÆØÅ0-9\s]+")
+_WHITESPACE = re.compile(r"\s+")
 
+
+@lru_cache(maxsize=1 << 18)
 def preprocess_text(text: str) -> str:
-    text = text.lower()
-    text = re.sub(r"[^a-zæøåA-ZÆØÅ0-9\s]", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
-
-
-def build_cost_matrix(narc_ids: List[Tuple[str, int]], ud_ids: List[str], doc2sentids: Dict[str, List[str]]):
-    m = zeros((len(narc_ids), len(ud_ids)))
-    for i in range(len(narc_ids)):
-        for j in range(len(ud_ids)):
-            m[i][j] += sent_to_UD_dist_score(narc_ids[i], ud_ids[j], doc2sentids)
-    return m
+    # the same sentences and tokens are normalized many times per run, so memoize them
+    text = _DISALLOWED_CHARS.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def normalization_cache_info() -> str:
+    info = preprocess_text.cache_info()
+    lookups = info.hits + info.misses
+    hit_rate = info.hits / lookups if lookups else 0
+    return f"{info.hits}/{lookups} ({hit_rate:.1%}) cache hits, {info.currsize} cached texts"
+
+
+def _resolved_neighbours(narc_ids: List[Tuple[str, int]], doc2index: Dict[str, SentIdIndex]) -> Tuple[np.ndarray, ...]:
+    # the closest resolved UD ID before and after each NARC position, -1 if there is none,
+    # and how many sentences away from the position it is
+    prev_udids = np.full(len(narc_ids), -1, dtype=np.int64)
+    next_udids = np.full(len(narc_ids), -1, dtype=np.int64)
+    prev_gaps = np.ones(len(narc_ids), dtype=np.int64)
+    next_gaps = np.ones(len(narc_ids), dtype=np.int64)
+    for i, (doc, sentord) in enumerate(narc_ids):
+        index = doc2index[doc]
+        prev_pos = index.prev_pos(sentord)
+        if prev_pos is not None:
+            prev_udids[i] = int(index.sentids[prev_pos])
+            prev_gaps[i] = sentord - prev_pos
+        next_pos = index.next_pos(sentord)
+        if next_pos is not None:
+            next_udids[i] = int(index.sentids[next_pos])
+            next_gaps[i] = next_pos - sentord
+    return prev_udids, prev_gaps, next_udids, next_gaps
+
+
+def build_cost_matrix(narc_ids: List[Tuple[str, int]], ud_ids: List[str], doc2index: Dict[str, SentIdIndex]):
+    # score all (NARC position, UD candidate) pairs at once:
+    # a candidate should be as many UD sentences away from the closest resolved
+    # neighbours as the NARC position is from their positions, and on the right side of them
+    prev_udids, prev_gaps, next_udids, next_gaps = _resolved_neighbours(narc_ids, doc2index)
+    udids = np.array([int(udid) for udid in ud_ids], dtype=np.int64)
+
+    prev_dist = udids[None, :] - prev_udids[:, None]
+    prev_score = 100 * np.abs(prev_dist - prev_gaps[:, None]) + 10 * (prev_dist <= 0)
+    next_dist = next_udids[:, None] - udids[None, :]
+    next_score = 100 * np.abs(next_dist - next_gaps[:, None]) + 10 * (next_dist <= 0)
+
+    m = np.where(prev_udids[:, None] >= 0, prev_score, 0) + \
+        np.where(next_udids[:, None] >= 0, next_score, 0)
+    return m.astype(np.float64)
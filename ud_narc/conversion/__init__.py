@@ -1,3 +1,27 @@
-from conversion.convert import *
-from conversion.parse_ann_to_json import *
-from conversion.parse_json_to_conll import *
+import importlib
+
+# submodules are only imported once one of their names is used, so that
+# importing the package does not pull in numpy, conllu or tqdm
+_EXPORTS = {
+    "ConversionError": "conversion.convert",
+    "convert_file": "conversion.convert",
+    "convert": "conversion.convert",
+    "GenericParser": "conversion.generic_parser",
+    "Ann2Json": "conversion.parse_ann_to_json",
+    "Ann2Conll": "conversion.parse_ann_to_conll",
+    "Json2Conll": "conversion.parse_json_to_conll",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
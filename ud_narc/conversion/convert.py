@@ -1,10 +1,54 @@
 import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 
+import instrumentation
 from conversion.generic_parser import GenericParser
-from tqdm import tqdm
+from stage_cache import StageCache, input_digest
 
 
-def convert(source_path: str, output_path: str, parser: GenericParser):
+class ConversionError(Exception):
+    """Raised after a conversion run, with the errors of every failed file."""
+
+    def __init__(self, errors: List[Tuple[str, str]]):
+        self.errors = errors
+        report = "\n".join(f"--- {file}\n{error}" for file, error in errors)
+        super().__init__(f"{len(errors)} file(s) failed to convert:\n{report}")
+
+
+def convert_file(
+    parser: GenericParser, file_path: str, out_file: str, parser_kwargs: Optional[dict] = None
+) -> Tuple[Optional[str], instrumentation.StageRecord]:
+    """
+    Parses a single file and writes the converted file.
+
+    Returns:
+        Optional[str]: the traceback if the conversion failed, otherwise None
+        StageRecord: the counters and the time of the conversion, see instrumentation
+    """
+    error = None
+    with instrumentation.collect() as record:
+        start = time.perf_counter()
+        try:
+            _parser = parser(file_path, **(parser_kwargs or {}))
+            _parser.parse()
+            _parser.write(out_file)
+        except Exception:
+            error = traceback.format_exc()
+        instrumentation.document(os.path.basename(file_path), time.perf_counter() - start)
+    return error, record
+
+
+def convert(
+    source_path: str,
+    output_path: str,
+    parser: GenericParser,
+    workers: Optional[int] = None,
+    cache: Optional[StageCache] = None,
+    parser_kwargs: Optional[dict] = None,
+):
     if not os.path.exists(source_path):
         raise FileNotFoundError(
             f"No annotation files found in path: {source_path}"
@@ -17,12 +61,64 @@ def convert(source_path: str, output_path: str, parser: GenericParser):
 
     files = [f for f in sorted(os.listdir(
         source_path)) if f.endswith(parser.FROM_FILE)]
+    instrumentation.count("files", len(files))
+    file_paths = [os.path.join(source_path, _file) for _file in files]
+    out_files = [
+        os.path.join(output_path, _file.replace(parser.FROM_FILE, parser.TO_FILE))
+        for _file in files
+    ]
+
+    if cache is not None:
+        # only convert the documents whose inputs changed since the last run
+        stage = os.path.basename(os.path.normpath(output_path))
+        digests = [
+            input_digest(parser.input_files(file_path), parser.__name__, repr(parser_kwargs))
+            for file_path in file_paths
+        ]
+        stale = [
+            i for i, (_file, digest, out_file) in enumerate(zip(files, digests, out_files))
+            if not cache.is_fresh(stage, _file, digest, outputs=[out_file])
+        ]
+        print(f"{len(files) - len(stale)}/{len(files)} files are up to date")
+        files = [files[i] for i in stale]
+        file_paths = [file_paths[i] for i in stale]
+        out_files = [out_files[i] for i in stale]
+        digests = [digests[i] for i in stale]
+
+    instrumentation.count("converted", len(files))
+
+    # tqdm takes tens of milliseconds to import, which pool workers need not pay
+    from tqdm import tqdm
+
+    # documents are independent of each other, spread them over a process pool
+    workers = min(workers or os.cpu_count() or 1, max(len(files), 1))
+    parsers = [parser] * len(files)
+    kwargs = [parser_kwargs] * len(files)
+    errors, records = [], []
+    if workers == 1:
+        results = map(convert_file, parsers, file_paths, out_files, kwargs)
+        for error, record in tqdm(results, total=len(files)):
+            errors.append(error)
+            records.append(record)
+            instrumentation.add(record)
+    else:
+        chunksize = max(1, len(files) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                convert_file, parsers, file_paths, out_files, kwargs, chunksize=chunksize)
+            # map yields in submission order, keeping the error report deterministic
+            for error, record in tqdm(results, total=len(files)):
+                errors.append(error)
+                records.append(record)
+                instrumentation.add(record)
 
-    for _file in tqdm(files):
-        file_path = os.path.join(source_path, _file)
-        _parser = parser(file_path)
-        _parser.parse()
+    if cache is not None:
+        for _file, digest, error, record in zip(files, digests, errors, records):
+            if not error:
+                cache.update(stage, _file, digest, diagnostics=record.diagnostics)
+        cache.save()
 
-        converted = _file.replace(parser.FROM_FILE, parser.TO_FILE)
-        out_file = os.path.join(output_path, converted)
-        _parser.write(out_file)
+    failed = [(file, error) for file, error in zip(files, errors) if error]
+    instrumentation.count("failed", len(failed))
+    if failed:
+        raise ConversionError(failed)
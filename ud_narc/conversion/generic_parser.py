@@ -7,6 +7,11 @@ class GenericParser(ABC):
     def __init__(self, file_path):
         self.file_path = file_path
 
+    @classmethod
+    def input_files(cls, file_path):
+        # the files whose contents determine the converted output
+        return [file_path]
+
     @abstractmethod
     def parse(self):
         raise NotImplementedError
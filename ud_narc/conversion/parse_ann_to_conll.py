@@ -0,0 +1,41 @@
+import os
+
+from conversion.generic_parser import GenericParser
+from conversion.parse_ann_to_json import Ann2Json
+from conversion.parse_json_to_conll import Json2Conll
+from custom_types import FileTypes
+
+
+class Ann2Conll(GenericParser):
+    """
+    Converts brat annotations straight to CoNLL-U, passing the parsed
+    Ann2Json document to Json2Conll in memory.
+    The intermediate .jsonl files are only written if json_folder is given.
+    """
+
+    FROM_FILE = FileTypes.ANN.value
+    TO_FILE = FileTypes.CONLL.value
+
+    def __init__(self, in_file, json_folder=None):
+        self.file_path = in_file
+        self.json_folder = json_folder
+        self.ann2json = Ann2Json(in_file)
+        self.json2conll: Json2Conll = None
+
+    @classmethod
+    def input_files(cls, file_path):
+        return Ann2Json.input_files(file_path)
+
+    def parse(self, mode="DEFAULT"):
+        self.ann2json.parse()
+        self.json2conll = Json2Conll.from_json(self.ann2json.json)
+        self.json2conll.parse(mode=mode)
+
+    def write(self, out_file):
+        self.json2conll.write(out_file)
+        if self.json_folder:
+            # debug artifact, identical to the output of Ann2Json
+            os.makedirs(self.json_folder, exist_ok=True)
+            json_file = os.path.basename(self.file_path).replace(
+                self.FROM_FILE, Ann2Json.TO_FILE)
+            self.ann2json.write(os.path.join(self.json_folder, json_file))
@@ -2,8 +2,10 @@ import json
 import os
 from typing import Dict, List, Set
 
+import instrumentation
 from conversion.generic_parser import GenericParser
 from conversion.utils_ann import (
+    INVALID_MENTION_LINKS,
     extract_token_mapping,
     get_invalid_mention_links,
     get_reference_content,
@@ -12,8 +14,6 @@ from conversion.utils_ann import (
 )
 from custom_types import FileTypes
 
-invalid_mention_links = get_invalid_mention_links()
-
 
 class Ann2Json(GenericParser):
     FROM_FILE = FileTypes.ANN.value
@@ -34,14 +34,22 @@ class Ann2Json(GenericParser):
         # for k, v in replace_map.items():
         #     self._id = self._id.replace(k, v)
 
-        self.invalid: Set[str] = invalid_mention_links[self._id]
+        self.invalid: Set[str] = get_invalid_mention_links().get(self._id, set())
         self.json: Dict[str, str] = None
 
+    @classmethod
+    def input_files(cls, file_path):
+        return [file_path, cls.txt_path(file_path), INVALID_MENTION_LINKS]
+
+    @classmethod
+    def txt_path(cls, in_file):
+        return in_file.split(cls.FROM_FILE)[0] + ".txt"
+
     def load(self, in_file):
         with open(in_file, "r", encoding="utf-8") as f:
             self.data = f.readlines()
         # txt:
-        txt_path = in_file.split(self.FROM_FILE)[0] + ".txt"
+        txt_path = self.txt_path(in_file)
         with open(txt_path, "r", encoding="utf-8") as f:
             self.text = "".join(f.readlines())
 
@@ -62,6 +70,9 @@ class Ann2Json(GenericParser):
 
         sents, tokens, char_to_word_map = extract_token_mapping(self.text)
         markable_by_word = markable_char_to_word(markables, char_to_word_map)
+        instrumentation.count("sentences", len(sents))
+        instrumentation.count("tokens", len(tokens))
+        instrumentation.count("mentions", len(markable_by_word))
 
         self.json = {
             "doc_key": self._id,
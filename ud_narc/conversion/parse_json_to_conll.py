@@ -1,12 +1,13 @@
 import json
-import os
 from collections import defaultdict
 
+import diagnostics
 from conversion.generic_parser import GenericParser
 from conversion.utils_json import (make_conllu_line, make_feature_connection,
                                    make_markable, make_misc_string)
 from custom_types import ConlluType, FileTypes, NARCType
 from util import NEWLINE
+from writers import join_document, write_document
 
 
 class Json2Conll(GenericParser):
@@ -15,24 +16,37 @@ class Json2Conll(GenericParser):
     TO_FILE = FileTypes.CONLL.value
     FEATURES = [NARCType.BRIDGE, NARCType.SPLIT]
 
-    def __init__(self, in_file: str) -> None:
-        self.corrected_spans = []
+    def __init__(self, in_file: str = None, json_data: dict = None) -> None:
         self.mode = "DEFAULT"
-        self.load(in_file)
+        if json_data is not None:
+            self.load_json(json_data)
+        else:
+            self.load(in_file)
 
         self.misc_dict = defaultdict(lambda: defaultdict(list))
         self.entity_info = defaultdict(list)
 
+    @classmethod
+    def from_json(cls, json_data: dict) -> "Json2Conll":
+        # build directly from the dict of Ann2Json.parse, skipping the .jsonl round trip
+        return cls(json_data=json_data)
+
     def load(self, in_file):
         with open(in_file, "r", encoding="utf-8") as f:
-            json_data = json.load(f)
-
-            self._id = json_data["doc_key"]
-            self.tokens = json_data["tokens"]
-            self.sentences = json_data["sentences"]
-            self.clusters = json_data["references"]
-            self.markables = json_data["markables"]
-            self.cluster_map = json_data["cluster_map"]
+            self.load_json(json.load(f))
+
+    def load_json(self, json_data):
+        self._id = json_data["doc_key"]
+        self.tokens = json_data["tokens"]
+        self.sentences = json_data["sentences"]
+        self.clusters = json_data["references"]
+        # spans are adjusted in place by strip_trailing_punct,
+        # so copy them into lists like the ones json.load creates
+        self.markables = {
+            markable: [list(span) for span in spans]
+            for markable, spans in json_data["markables"].items()
+        }
+        self.cluster_map = json_data["cluster_map"]
 
     def enrich_markable(self, markable):
         # there's two options here:
@@ -60,12 +74,6 @@ class Json2Conll(GenericParser):
         self.populate_entities()
         for feature in self.FEATURES:
             self.add_feature(feature)
-        # only for debugging purposes:
-        if len(self.corrected_spans) > 0:
-            with open("output/ERROR_CORRECTED_SPANS.txt", "a", encoding="utf-8") as f:
-                f.write(
-                    "\n".join([f"{line[0]},{line[1]},{line[2]}" for line in self.corrected_spans]))
-                f.write("\n")
 
     def strip_trailing_punct(self):
         mentions_to_remove = set()
@@ -75,8 +83,10 @@ class Json2Conll(GenericParser):
             for i in range(len(span)):
                 # adjust span
                 if self.tokens[span[i][1]] in self.ERROR_SPAN_CHARS:
-                    self.corrected_spans.append((self._id, markable, span[i]))
                     span[i][1] -= 1
+                    diagnostics.report(
+                        "corrected_span", "Span {span} of {markable} in {doc} stripped of its trailing punctuation",
+                        level="info", doc=self._id, markable=markable, span=list(span[i]))
                 # if the mention end precedes the its start, label the span part to be removed
                 if span[i][1] < span[i][0]:
                     span_to_remove.add(i)
@@ -97,8 +107,9 @@ class Json2Conll(GenericParser):
 
             frozenspan = tuple(tuple(s) for s in span)
             if frozenspan in added_spans:
-                print(
-                    f"[WARN] Skipping mention spanning {frozenspan} of the cluster {m_base_id}.")
+                diagnostics.report(
+                    "duplicate_mention", "Skipping mention spanning {span} of the cluster {cluster}.",
+                    doc=self._id, markable=markable, span=[list(s) for s in frozenspan], cluster=m_base_id)
                 continue
 
             if not m_base_id:  # skip invalid entities
@@ -156,32 +167,27 @@ class Json2Conll(GenericParser):
             self.append_feature_pair(link, feature_key)
 
     def write(self, out_file):
-        with open(os.path.join(out_file), "w", encoding="utf-8") as conll_file:
-            conll_file.write(f"# newdoc id = {self._id}{NEWLINE}")
-            conll_file.write("# global.Entity = eid-etype-head-other")
-
-            sent_id = 0  # manual control over index due to empty sentences
-            tok_id = 0
+        writer = [f"# newdoc id = {self._id}{NEWLINE}", "# global.Entity = eid-etype-head-other"]
 
-            writer = []
+        sent_id = 0  # manual control over index due to empty sentences
+        tok_id = 0
 
-            for sent in self.sentences:
-                if len(" ".join(sent)) == 0:
-                    tok_id += 1
-                    continue
+        for sent in self.sentences:
+            if len(" ".join(sent)) == 0:
+                tok_id += 1
+                continue
+            writer.append(NEWLINE)
+            writer.append(f"# sent_id = {sent_id}{NEWLINE}")
+            writer.append(f"# text = {' '.join(sent)}{NEWLINE}")
+            for sent_tok_id, tok in enumerate(sent):
+                misc_string = make_misc_string(
+                    misc=self.misc_dict[tok_id],
+                    ents=self.entity_info[tok_id],
+                )
+                conllu = make_conllu_line(sent_tok_id, tok, misc_string)
+                writer.append(conllu)
                 writer.append(NEWLINE)
-                writer.append(f"# sent_id = {sent_id}{NEWLINE}")
-                writer.append(f"# text = {' '.join(sent)}{NEWLINE}")
-                for sent_tok_id, tok in enumerate(sent):
-                    misc_string = make_misc_string(
-                        misc=self.misc_dict[tok_id],
-                        ents=self.entity_info[tok_id],
-                    )
-                    conllu = make_conllu_line(sent_tok_id, tok, misc_string)
-                    writer.append(conllu)
-                    writer.append(NEWLINE)
-                    tok_id += 1
-                sent_id += 1
-            writer.pop()  # remove last newline
-            for writable in writer:
-                conll_file.write(writable)
+                tok_id += 1
+            sent_id += 1
+        writer.pop()  # remove last newline
+        write_document(out_file, join_document(writer))
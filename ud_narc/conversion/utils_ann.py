@@ -1,8 +1,13 @@
+import os
 from collections import defaultdict
-from copy import deepcopy
-from typing import Dict, List, Tuple
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
 
-import networkx as nx
+import numpy as np
+
+import diagnostics
+from union_find import cluster_links
 
 Mention = Tuple[int, int]  # (start, end)
 RawMarkable = List[str]  # [T1, T2]
@@ -17,13 +22,15 @@ References = Dict[str, Corefs]
 ClusterMapping = Dict[str, str]
 ClusterList = List[List[str]]
 
+INVALID_MENTION_LINKS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "invalid_mentions_links.txt")
+
 
+@lru_cache(maxsize=None)
 def get_invalid_mention_links():
-    # manually controlled invalid mention links
+    # manually controlled invalid mention links, read once on first use
     invalid_mention_links = defaultdict(set)
-    with open(
-        "ud_narc/conversion/invalid_mentions_links.txt", "r", encoding="utf-8"
-    ) as f:
+    with open(INVALID_MENTION_LINKS, "r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
             if line and "#" not in line:
@@ -60,7 +67,9 @@ def get_references(
     for line in ann_data:
         line_parts = line.split("\t")
         if len(line_parts) < 2:
-            print(f"Line {line} is not a valid annotation -- Ignoring and continuing")
+            diagnostics.report(
+                "invalid_annotation", "Line {line!r} is not a valid annotation -- Ignoring and continuing",
+                line=line)
             continue
 
         _id, ref_data, *_ = line_parts
@@ -84,23 +93,18 @@ def get_references(
     return markables, references
 
 
-def cluster_references(corefs: Corefs) -> List[MarkableConnection]:
-    # treat coreference links as edges in a graph
-    # clusters are then connected components of the graph
-    coref_graph = nx.Graph()
-    for arg1, arg2 in corefs:
-        coref_graph.add_edge(arg1, arg2)
-    return [list(c) for c in nx.connected_components(coref_graph)]
+def cluster_references(links: Corefs) -> ClusterList:
+    # treat the links (Coref, Bridging or Split_antecedent) as edges in a graph
+    # clusters are then connected components of the graph, in order of first appearance
+    return cluster_links((arg1, arg2) for arg1, arg2 in links)
 
 
 def get_reference_content(
-    markables: Markables, references: References
+    markables: Markables, references: References, link_type: str = "Coref"
 ) -> Tuple[ClusterMapping, ClusterList]:
 
     cluster_map: ClusterMapping = {}
-    clustered_references: List[MarkableConnection] = cluster_references(
-        deepcopy(references["Coref"])
-    )
+    clustered_references: ClusterList = cluster_references(references[link_type])
 
     for cluster in clustered_references:
         # to identify the cluster in jsonl format
@@ -112,7 +116,8 @@ def get_reference_content(
         tmp_cluster = []
         for markable in cluster:
             if markable not in markables:
-                print(f"Markable {markable} not found in markables")
+                diagnostics.report("unknown_markable", "Markable {markable} not found in markables",
+                                   markable=markable)
                 continue
             markable_spans = markables[markable]
             for span in markable_spans:
@@ -122,45 +127,74 @@ def get_reference_content(
     return cluster_map, parsed_clusters
 
 
+class CharToWordMap(Mapping):
+    """
+    Maps character offsets of a document text to word indices, stored as the
+    sorted offsets of the separators that end each word. A character belongs
+    to the word of the first separator at or after it, so a separator maps to
+    the word it ends.
+
+    Only offsets within the text are mapped; others raise a KeyError.
+    """
+
+    def __init__(self, separators: np.ndarray, text_length: int):
+        self.separators = separators
+        self.text_length = text_length
+
+    def __getitem__(self, char_index: int) -> int:
+        if not 0 <= char_index < self.text_length:
+            raise KeyError(char_index)
+        return int(np.searchsorted(self.separators, char_index))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.text_length))
+
+    def __len__(self) -> int:
+        return self.text_length
+
+    def lookup(self, char_indices: List[int]) -> List[int]:
+        # all offsets at once, in a single search
+        char_indices = np.asarray(char_indices, dtype=np.int64)
+        outside = (char_indices < 0) | (char_indices >= self.text_length)
+        if outside.any():
+            raise KeyError(int(char_indices[outside][0]))
+        return np.searchsorted(self.separators, char_indices).tolist()
+
+
 def extract_token_mapping(
     text: str,
-) -> Tuple[List[List[str]], List[str], Dict[int, int]]:
-
-    current_word_idx = 0
-    tokens = []
-    sentences = []
-
-    current_token = ""
-
-    current_sentence = []
-    char_to_word_map = {}
-
-    for char_index, char in enumerate(text):
-        char_to_word_map[char_index] = current_word_idx
-        if char in [" ", "\n"]:
-            tokens.append(current_token)
-            current_sentence.append(current_token)
-            current_token = ""
-            current_word_idx += 1
-            if char == "\n":
-                sentences.append(current_sentence)
-                current_sentence = []
-        else:
-            current_token += char
-    return sentences, tokens, char_to_word_map
+) -> Tuple[List[List[str]], List[str], CharToWordMap]:
+    # words end at every space or newline, sentences at every newline.
+    # text after the last separator is not a word of its own
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    separators = np.flatnonzero((codes == ord(" ")) | (codes == ord("\n")))
+
+    *lines, last_line = text.split("\n")
+    sentences = [line.split(" ") for line in lines]
+    tokens = [token for sentence in sentences for token in sentence]
+    tokens.extend(last_line.split(" ")[:-1])
+    return sentences, tokens, CharToWordMap(separators, len(text))
 
 
 def markable_char_to_word(
-    markables: Markables, char_to_word_map: Dict[int, int]
+    markables: Markables, char_to_word_map: CharToWordMap
 ) -> Dict[int, List[Tuple[int, int]]]:
 
+    boundaries = [
+        boundary
+        for spans in markables.values()
+        for start, end in spans
+        for boundary in (start, end)
+    ]
+    words = iter(char_to_word_map.lookup(boundaries))
+
     markable_by_word = {}
 
     for markable_id, spans in markables.items():
         word_spans = []
-        for start, end in spans:
-            w_start = char_to_word_map[start]
-            w_end = char_to_word_map[end]
+        for _ in spans:
+            w_start = next(words)
+            w_end = next(words)
             word_spans.append((w_start, w_end))
         markable_by_word[markable_id] = word_spans
 
@@ -0,0 +1,78 @@
+"""
+Diagnostics of the pipeline: the sentences that could not be matched, the
+spans that were corrected, the documents that were excluded, and so on.
+
+Every diagnostic is a typed record (kind, level, document, sentence and
+details). It is kept in memory in the stage that is being run (see
+instrumentation), is sent back from worker processes with the other
+counters of the stage, and is written once per run with the run report,
+one JSON line per record. Only diagnostics at or above the log level
+are printed as well.
+"""
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional, Union
+
+import instrumentation
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+# the log level is kept in the environment as well, such that worker
+# processes that are spawned rather than forked use the same one
+LEVEL_ENV = "UD_NARC_LOG_LEVEL"
+DEFAULT_LEVEL = "warning"
+
+
+@dataclass
+class Diagnostic:
+    kind: str
+    level: str = "warning"
+    doc: Optional[str] = None
+    # position of the sentence in a NARC document (from 1), or a UD sent_id
+    sentence: Optional[Union[int, str]] = None
+    detail: Dict[str, Any] = field(default_factory=dict)
+
+    def to_json(self, stage: Optional[str] = None) -> dict:
+        return {"stage": stage, **asdict(self)}
+
+
+def _level_value(level: str) -> int:
+    if level not in LEVELS:
+        raise ValueError(f"Unknown log level {level!r}, expected one of {', '.join(LEVELS)}")
+    return LEVELS[level]
+
+
+_console_level = _level_value(os.environ.get(LEVEL_ENV, DEFAULT_LEVEL))
+
+
+def set_level(level: str) -> None:
+    """
+    Sets the lowest level of the diagnostics that are printed.
+    """
+    global _console_level
+    _console_level = _level_value(level)
+    os.environ[LEVEL_ENV] = level
+
+
+def report(
+    kind: str,
+    message: str,
+    level: str = "warning",
+    doc: Optional[str] = None,
+    sentence: Optional[Union[int, str]] = None,
+    **detail: Any,
+) -> None:
+    """
+    Records a diagnostic, and prints it if its level is high enough.
+
+    Args:
+        kind (str): what happened, e.g. "no_sentence_match"
+        message (str): a format string for the console, filled with doc,
+            sentence and the details. It is only formatted if printed.
+        level (str): debug, info, warning or error
+        doc (str, optional): the document
+        sentence (int or str, optional): the sentence within the document
+        **detail: anything else, it must be JSON serializable
+    """
+    instrumentation.record_diagnostic(Diagnostic(kind, level, doc, sentence, detail))
+    if LEVELS[level] >= _console_level:
+        print(f"[{level.upper()}] {message.format(doc=doc, sentence=sentence, **detail)}")
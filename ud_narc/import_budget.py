@@ -0,0 +1,75 @@
+"""
+Checks the import time of the ud_narc modules against a budget.
+
+Every module is imported in a fresh interpreter, from outside the repository
+to catch imports that depend on the working directory. The fastest of a few
+runs is compared to the budget. On a regression, the slowest imports of the
+module are listed, from `python -X importtime`.
+
+Usage: python ud_narc/import_budget.py [--repeat N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+CODE_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# milliseconds, about twice what the import takes on a laptop. The packages
+# themselves import nothing until one of their names is used
+BUDGETS_MS = {
+    "conversion": 20,
+    "alignment": 20,
+    "conversion.convert": 200,
+    "conversion.parse_ann_to_conll": 250,
+    "alignment.ud_index": 200,
+    "alignment.build_ud_narc_map": 250,
+    "alignment.merge_ud_narc": 300,
+}
+
+TIMER = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def _run(args, cwd):
+    env = {**os.environ, "PYTHONPATH": CODE_ROOT}
+    return subprocess.run(
+        [sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+
+
+def import_time_ms(module: str, repeat: int, cwd: str) -> float:
+    return min(
+        float(_run(["-c", TIMER.format(module=module)], cwd).stdout) * 1000
+        for _ in range(repeat)
+    )
+
+
+def slowest_imports(module: str, cwd: str, n: int = 5):
+    # lines of `-X importtime` read: "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in _run(["-X", "importtime", "-c", f"import {module}"], cwd).stderr.splitlines():
+        _, _, timings = line.partition("import time:")
+        _, cumulative, name = timings.split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5, help="Imports per module, the fastest counts")
+    args = parser.parse_args()
+
+    over_budget = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for module, budget in BUDGETS_MS.items():
+            took = import_time_ms(module, args.repeat, cwd)
+            status = "ok" if took <= budget else "OVER BUDGET"
+            print(f"{module:<32} {took:7.1f} ms  (budget {budget} ms)  {status}")
+            if took > budget:
+                over_budget.append(module)
+                for cumulative, name in slowest_imports(module, cwd):
+                    print(f"    {cumulative:7.1f} ms {name}")
+
+    if over_budget:
+        sys.exit(f"{len(over_budget)} module(s) over their import time budget")
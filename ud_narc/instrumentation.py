@@ -0,0 +1,266 @@
+"""
+Instrumentation of the pipeline stages.
+
+A RunReport times every stage it wraps (wall and CPU time, including that of
+worker processes), records the peak RSS of the stage and counters, and keeps
+the slowest documents of the stage. The stages record their counters with count() and
+the time spent on a document with document(), which do nothing outside of a
+stage, so the instrumented code runs the same without a report.
+
+Worker processes collect their counters with collect() and send the record
+back, to be added to the stage with add(). The records also carry the
+diagnostics of the stage (see diagnostics), which are written with the report.
+"""
+import heapq
+import json
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+@dataclass
+class StageRecord:
+    name: str
+    slowest: int = 10  # documents kept, all of them if None
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    children_cpu_s: float = 0.0
+    peak_rss_mib: Optional[float] = None  # of this process, during the stage
+    rss_growth_mib: Optional[float] = None  # of the peak above the RSS at the start of the stage
+    worker_peak_rss_mib: Optional[float] = None  # of the largest worker job
+    process_max_rss_mib: Optional[float] = None  # of this process, over its lifetime
+    counters: Counter = field(default_factory=Counter)
+    documents: List[Tuple[float, str]] = field(default_factory=list)  # a min-heap if bounded
+    diagnostics: List[Any] = field(default_factory=list)  # diagnostics.Diagnostic
+    profile: Optional[str] = None
+    pid: int = field(default_factory=os.getpid)
+
+    def add_document(self, doc: str, seconds: float) -> None:
+        if self.slowest is None:
+            self.documents.append((seconds, doc))
+        elif len(self.documents) < self.slowest:
+            heapq.heappush(self.documents, (seconds, doc))
+        elif self.slowest:
+            heapq.heappushpop(self.documents, (seconds, doc))
+
+    def to_json(self) -> dict:
+        return {
+            "name": self.name,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "children_cpu_s": round(self.children_cpu_s, 6),
+            "peak_rss_mib": self.peak_rss_mib,
+            "rss_growth_mib": self.rss_growth_mib,
+            "worker_peak_rss_mib": self.worker_peak_rss_mib,
+            "process_max_rss_mib": self.process_max_rss_mib,
+            "counters": dict(sorted(self.counters.items())),
+            "diagnostics": dict(sorted(Counter(d.kind for d in self.diagnostics).items())),
+            "slowest_documents": [
+                {"document": doc, "seconds": round(seconds, 6)}
+                for seconds, doc in sorted(self.documents, reverse=True)
+            ],
+            "profile": self.profile,
+        }
+
+
+# the stage being run, which count() and document() record into
+_active: Optional[StageRecord] = None
+
+
+def count(name: str, n: int = 1) -> None:
+    if _active is not None:
+        _active.counters[name] += n
+
+
+def document(doc: str, seconds: float) -> None:
+    if _active is not None:
+        _active.add_document(doc, seconds)
+
+
+def record_diagnostic(diagnostic) -> None:
+    if _active is not None:
+        _active.diagnostics.append(diagnostic)
+
+
+@contextmanager
+def collect() -> Iterator[StageRecord]:
+    """
+    Collects the counters and documents recorded in its body into a separate
+    record, e.g. in a worker process, to be returned and add()ed to the stage.
+    In a worker process, the record also gets the peak RSS of the body.
+    """
+    global _active
+    record = StageRecord("collected", slowest=None)
+    previous, _active = _active, record
+    # a stage of this process is measured as a whole, its peak must not be reset
+    in_worker = previous is None or previous.pid != record.pid
+    peak_reset = in_worker and _reset_peak_rss()
+    try:
+        yield record
+    finally:
+        _active = previous
+        if in_worker:
+            # without a reset, the peak of the worker so far, which the pools
+            # of the stages start and stop within the stage
+            record.worker_peak_rss_mib = _peak_rss_mib() if peak_reset else _max_rss_mib()
+
+
+def add(record: StageRecord) -> None:
+    if _active is not None:
+        _active.counters.update(record.counters)
+        _active.diagnostics.extend(record.diagnostics)
+        if record.worker_peak_rss_mib is not None:
+            _active.worker_peak_rss_mib = max(_active.worker_peak_rss_mib or 0.0, record.worker_peak_rss_mib)
+        for seconds, doc in record.documents:
+            _active.add_document(doc, seconds)
+
+
+def _max_rss_mib() -> Optional[float]:
+    # the peak over the lifetime of the process, which can not be reset
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(max_rss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def _reset_peak_rss() -> bool:
+    # Linux only: sets the peak RSS of the process (VmHWM) back to its current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _status_mib(key: str) -> Optional[float]:
+    # VmHWM (the peak RSS) or VmRSS of the process, Linux only
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{key}:"):
+                    return round(int(line.split()[1]) / (1 << 10), 1)  # kilobytes
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mib() -> Optional[float]:
+    return _status_mib("VmHWM")
+
+
+class RunReport:
+    """
+    Records the stages of a run and writes them as JSON.
+
+    Args:
+        path (str): the report file
+        diagnostics_path (str, optional): if given, the diagnostics of all
+            stages are written there, one JSON line each
+        profile_dir (str, optional): if given, every stage is run under cProfile
+            and its stats are dumped to {profile_dir}/{stage}.prof. Only this
+            process is profiled, not its workers.
+        slowest (int): the number of slowest documents listed per stage
+    """
+
+    def __init__(
+        self,
+        path: str,
+        profile_dir: Optional[str] = None,
+        slowest: int = 10,
+        diagnostics_path: Optional[str] = None,
+    ):
+        self.path = path
+        self.diagnostics_path = diagnostics_path
+        self.profile_dir = profile_dir
+        self.slowest = slowest
+        self.stages: List[StageRecord] = []
+        self.started = time.time()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        global _active
+        record = StageRecord(name, slowest=self.slowest)
+        previous, _active = _active, record
+
+        # where the peak can not be reset, the stage peak is unknown
+        peak_reset = _reset_peak_rss()
+        start_rss = _status_mib("VmRSS")
+        profiler = None
+        if self.profile_dir:
+            import cProfile
+
+            profiler = cProfile.Profile()
+        times = os.times()
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record.wall_s = time.perf_counter() - start
+            end_times = os.times()
+            record.cpu_s = (end_times.user - times.user) + (end_times.system - times.system)
+            # only workers that have exited count, which the pools of the stages have
+            record.children_cpu_s = (end_times.children_user - times.children_user) + \
+                (end_times.children_system - times.children_system)
+            record.peak_rss_mib = _peak_rss_mib() if peak_reset else None
+            if record.peak_rss_mib is not None and start_rss is not None:
+                record.rss_growth_mib = round(max(record.peak_rss_mib - start_rss, 0.0), 1)
+            record.process_max_rss_mib = _max_rss_mib()
+            if profiler:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record.profile = os.path.join(self.profile_dir, f"{name}.prof")
+                profiler.dump_stats(record.profile)
+            _active = previous
+            self.stages.append(record)
+
+    def to_json(self) -> Dict:
+        import platform
+
+        return {
+            "argv": sys.argv,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+            "wall_s": round(time.perf_counter() - self._start, 6),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "stages": [stage.to_json() for stage in self.stages],
+        }
+
+    def write(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8", newline="\n") as f:
+            json.dump(self.to_json(), f, indent=2)
+        if self.diagnostics_path:
+            os.makedirs(os.path.dirname(self.diagnostics_path) or ".", exist_ok=True)
+            with open(self.diagnostics_path, "w", encoding="utf-8", newline="\n") as f:
+                for stage in self.stages:
+                    for diagnostic in stage.diagnostics:
+                        f.write(json.dumps(diagnostic.to_json(stage.name), ensure_ascii=False))
+                        f.write("\n")
+
+    def summary(self) -> str:
+        def mib(value: Optional[float]) -> str:
+            return "-" if value is None else f"{value:.0f} MiB"
+
+        lines = [f"{'stage':<24} {'wall':>9} {'cpu':>9} {'workers':>9} {'peak rss':>10} "
+                 f"{'growth':>10} {'worker rss':>10}"]
+        for stage in self.stages:
+            lines.append(f"{stage.name:<24} {stage.wall_s:8.2f}s {stage.cpu_s:8.2f}s "
+                         f"{stage.children_cpu_s:8.2f}s {mib(stage.peak_rss_mib):>10} "
+                         f"{mib(stage.rss_growth_mib):>10} {mib(stage.worker_peak_rss_mib):>10}")
+        return "\n".join(lines)
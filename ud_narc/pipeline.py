@@ -1,50 +1,140 @@
+import argparse
+import glob
 import os
 
+import diagnostics
 from align_norne import align_norne
-from alignment import build_map, combine_into_splits, merge
-from conversion import Ann2Json, Json2Conll, convert
-from util import get_ud_splits
+from alignment import UDIndex, build_map, get_combined_paths, merge
+from conversion import Ann2Conll, convert
+from instrumentation import RunReport, count
+from stage_cache import StageCache, input_digest
+from util import get_ud_split_paths
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--force", "-f", action="store_true", help="Rebuild every stage, ignoring the stage cache"
+    )
+    parser.add_argument(
+        "--write-jsonl",
+        action="store_true",
+        help="Also write the intermediate JSON of each document (for debugging)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help="Number of worker processes for the parallel stages (default: all CPUs)",
+    )
+    parser.add_argument(
+        "--report",
+        default=os.path.join("output", "run_report.json"),
+        help="Where to write the run report: time, memory and counters of every stage",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Run every stage under cProfile and dump its stats to DIR/{stage}.prof",
+    )
+    parser.add_argument(
+        "--slowest", type=int, default=10, help="Number of slowest documents listed per stage"
+    )
+    parser.add_argument(
+        "--diagnostics",
+        default=os.path.join("output", "diagnostics.jsonl"),
+        help="Where to write the diagnostics of the run (unmatched sentences, corrected spans, ...)",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=list(diagnostics.LEVELS),
+        default=diagnostics.DEFAULT_LEVEL,
+        help="Lowest level of the diagnostics that are also printed",
+    )
+    args = parser.parse_args()
+    diagnostics.set_level(args.log_level)
+
     langs = ["bokmaal", "nynorsk"]
 
     output_path = os.path.join(os.getcwd(), "output")
+    os.makedirs(output_path, exist_ok=True)
+    cache = StageCache(output_path, enabled=not args.force)
+    report = RunReport(args.report, profile_dir=args.profile, slowest=args.slowest,
+                       diagnostics_path=args.diagnostics)
 
     norne_path = os.path.join(os.getcwd(), "data", "norne", "ud")
     ud_path = os.path.join(os.getcwd(), "data", "UD")
     aligned_norne = os.path.join(output_path, "norne")
 
-    if os.path.exists(aligned_norne) and len(os.listdir(aligned_norne)) == 0:
-        os.rmdir(aligned_norne)
-    if not os.path.exists(aligned_norne):
-        align_norne(norne_path, ud_path, aligned_norne)
-
-    NARC = os.path.join(output_path, "narc")
-    VERSION = "v1.0"
-    os.makedirs(NARC, exist_ok=True)
+    try:
+        with report.stage("align_norne") as record:
+            norne_inputs = sorted(glob.glob(os.path.join(norne_path, "*", "*.conllu")))
+            norne_inputs += sorted(glob.glob(os.path.join(ud_path, "UD_Norwegian-*", "*.conllu")))
+            norne_outputs = [
+                os.path.join(aligned_norne, f"no_{lang}-ud-{split}.conllu")
+                for lang in langs
+                for split in ["train", "test", "dev"]
+            ]
+            norne_digest = input_digest(norne_inputs)
+            if cache.is_fresh("align_norne", "all", norne_digest, outputs=norne_outputs):
+                print(f"Aligned NorNE is up to date: {aligned_norne}")
+                count("up_to_date")
+            else:
+                align_norne(norne_path, ud_path, aligned_norne, jobs=args.jobs)
+                cache.update("align_norne", "all", norne_digest, diagnostics=record.diagnostics)
+                cache.save()
 
-    for lang in langs:
-        ANN_FOLDER = os.path.join(
-            os.getcwd(), "data", "narc", "data", VERSION, f"annotation_{lang}"
-        )
-        JSON_FOLDER = os.path.join(NARC, f"annotations_jsonlines_{lang}")
-        CONLL_FOLDER = os.path.join(NARC, f"annotations_conll_{lang}")
+        NARC = os.path.join(output_path, "narc")
+        VERSION = "v1.0"
+        os.makedirs(NARC, exist_ok=True)
 
-        # Step 1: Convert annotations to JSON -> CONLL, if needed
-        convert(ANN_FOLDER, JSON_FOLDER, parser=Ann2Json)
-        convert(JSON_FOLDER, CONLL_FOLDER, parser=Json2Conll)
+        for lang in langs:
+            ANN_FOLDER = os.path.join(
+                os.getcwd(), "data", "narc", "data", VERSION, f"annotation_{lang}"
+            )
+            JSON_FOLDER = os.path.join(NARC, f"annotations_jsonlines_{lang}")
+            CONLL_FOLDER = os.path.join(NARC, f"annotations_conll_{lang}")
 
-        # Step 2: Build map
-        ud_splits = get_ud_splits(ud_folder=aligned_norne, language=lang)
+            # Step 1: Convert annotations to CONLL, if needed
+            with report.stage(f"convert_{lang}"):
+                parser_kwargs = {"json_folder": JSON_FOLDER} if args.write_jsonl else None
+                convert(ANN_FOLDER, CONLL_FOLDER, parser=Ann2Conll, workers=args.jobs, cache=cache,
+                        parser_kwargs=parser_kwargs)
 
-        UD_SPLITS_FOLDER = os.path.join(NARC, f"UD_SPLITS_{lang}")
-        UD_DOC2SENT = os.path.join(NARC, f"UD_SPLITS_DOC2SENT_{lang}")
-        UD_ALIGNED = os.path.join(NARC, f"UD_ALIGNED_{lang}")
+            # Step 2: Build map
+            # the UD index is built once per treebank and reused until the UD files change
+            with report.stage(f"ud_index_{lang}"):
+                ud_split_paths = get_ud_split_paths(ud_folder=aligned_norne, language=lang)
+                ud_index = UDIndex.load_or_build(ud_split_paths, os.path.join(NARC, f"ud_index_{lang}.pickle"))
+                count("sentences", len(ud_index.udsentid2split))
 
-        build_map(ud_splits, ANN_FOLDER, UD_SPLITS_FOLDER, UD_DOC2SENT, lang)
+            UD_SPLITS_FOLDER = os.path.join(NARC, f"UD_SPLITS_{lang}")
+            UD_DOC2SENT = os.path.join(NARC, f"UD_SPLITS_DOC2SENT_{lang}")
+            UD_ALIGNED = os.path.join(NARC, f"UD_ALIGNED_{lang}")
 
-        # Step 3: Merge UD and annotations
-        merge(ud_splits, CONLL_FOLDER, UD_ALIGNED, UD_SPLITS_FOLDER, UD_DOC2SENT)
+            with report.stage(f"build_map_{lang}") as record:
+                narc_txts = sorted(glob.glob(os.path.join(ANN_FOLDER, "*.txt")))
+                map_digest = input_digest(list(ud_split_paths.values()) + narc_txts)
+                map_outputs = [
+                    os.path.join(folder, f"{split}.{ext}")
+                    for split in ud_split_paths
+                    for folder, ext in [(UD_SPLITS_FOLDER, "txt"), (UD_DOC2SENT, "json")]
+                ]
+                if cache.is_fresh("build_map", lang, map_digest, outputs=map_outputs):
+                    print(f"Mapping between NARC and UD is up to date: {UD_DOC2SENT}")
+                    count("up_to_date")
+                else:
+                    build_map(ud_index, ANN_FOLDER, UD_SPLITS_FOLDER, UD_DOC2SENT)
+                    cache.update("build_map", lang, map_digest, diagnostics=record.diagnostics)
+                    cache.save()
 
-        ALIGNED_OUTPUT = os.path.join(output_path, "aligned", f"no-narc_{lang}")
-        combine_into_splits(ALIGNED_OUTPUT, UD_ALIGNED, lang)
+            # Step 3: Merge UD and annotations, streaming every split into its combined file
+            with report.stage(f"merge_{lang}"):
+                ALIGNED_OUTPUT = os.path.join(output_path, "aligned", f"no-narc_{lang}")
+                merge(ud_index, CONLL_FOLDER, UD_ALIGNED, UD_SPLITS_FOLDER, UD_DOC2SENT, cache=cache,
+                      combined_files=get_combined_paths(ALIGNED_OUTPUT, lang))
+    finally:
+        # also written for a failed run, with the stages up to the failure
+        report.write()
+        print(report.summary())
+        print(f"Run report: {args.report}")
+        print(f"Diagnostics: {args.diagnostics}")
@@ -0,0 +1,300 @@
+from collections import deque
+from enum import Enum
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from conllu import TokenList, parse
+from tqdm import tqdm
+
+import diagnostics
+import instrumentation
+from util import read_sentences
+
+MISC_COLUMN = 9
+N_COLUMNS = 10
+
+
+class Match(Enum):
+    EQUAL = "equal"  # UD1 = source1
+    JOINED = "joined"  # UD1 = source1 + source2 (+ ...)
+    LEADING_TOKEN = "leading_token"  # UD1 = source1 without its first token
+
+
+class RawSentence:
+    """
+    The lines of a sentence in a CoNLL-U file, as they were read. Only the
+    comments are parsed, into metadata like that of a TokenList.
+    """
+
+    def __init__(self, lines: List[str]):
+        if not lines[-1].endswith("\n"):
+            # the last line of a file may lack its newline
+            lines[-1] += "\n"
+        self.lines = lines
+        self.metadata: Dict[str, str] = {}
+        for line in lines:
+            if not line.startswith("#"):
+                break
+            key, sep, value = line[1:].partition("=")
+            if sep:
+                self.metadata[key.strip()] = value.strip()
+
+    @property
+    def token_lines(self) -> List[str]:
+        return [line for line in self.lines if not line.startswith("#")]
+
+    def parse(self) -> TokenList:
+        return parse("".join(self.lines))[0]
+
+    def serialize(self) -> str:
+        return "".join(self.lines) + "\n"
+
+
+def read_raw_sentences(conllu_file: TextIO) -> Iterator[RawSentence]:
+    lines: List[str] = []
+    for line in conllu_file:
+        if line.strip():
+            lines.append(line)
+        elif lines:
+            yield RawSentence(lines)
+            lines = []
+    if lines:
+        yield RawSentence(lines)
+
+
+def merge_sentences(ud: TokenList, entity: TokenList) -> TokenList:
+    """
+    Merges the UD corpus data and the source corpus data for a single sentence.
+    Only the `name` annotation of the source is added to the UD tokens.
+
+    Args:
+        ud (TokenList): The UD corpus data for the sentence.
+        entity (TokenList): The source corpus data for the sentence.
+
+    Returns:
+        TokenList: The merged data.
+    """
+    ud_toks = [t for t in ud]
+    entity_toks = [t for t in entity]
+    for j, ud_tok in enumerate(ud_toks):
+        ud_misc = ud_tok["misc"] or {}
+        entity_misc = entity_toks[j]["misc"] or {}
+        entity_misc = {k: v for k, v in entity_misc.items() if k == "name"}
+        ud_misc.update(entity_misc)
+        ud_tok["misc"] = ud_misc
+
+    return TokenList(ud_toks)
+
+
+def _merge_misc(ud_misc: str, entity_misc: str) -> str:
+    # the text equivalent of merging the misc dicts in merge_sentences
+    names = [item for item in entity_misc.split("|") if item.partition("=")[0] == "name"]
+    if not names:
+        return ud_misc
+    items = [] if ud_misc == "_" else ud_misc.split("|")
+    keys = [item.partition("=")[0] for item in items]
+    if "name" not in keys:
+        return "|".join(items + names[-1:])
+    first = keys.index("name")
+    items = [item for i, item in enumerate(items) if i == first or keys[i] != "name"]
+    items[first] = names[-1]
+    return "|".join(items)
+
+
+def patch_sentence(ud: RawSentence, entity: RawSentence) -> Optional[str]:
+    """
+    Merges the `name` annotation of the source sentence into the MISC column
+    of the UD sentence, as merge_sentences does, without parsing either of
+    them. All other bytes of the UD sentence are kept as they are.
+
+    Returns:
+        Optional[str]: the merged sentence, or None if the token lines of the
+            two sentences cannot be paired column by column
+    """
+    entity_lines = entity.token_lines
+    out = []
+    j = 0
+    for line in ud.lines:
+        if line.startswith("#"):
+            out.append(line)
+            continue
+        if j >= len(entity_lines):
+            return None
+        ud_cols = line[:-1].split("\t")
+        entity_cols = entity_lines[j][:-1].split("\t")
+        j += 1
+        if len(ud_cols) != N_COLUMNS or len(entity_cols) != N_COLUMNS:
+            return None
+        misc = _merge_misc(ud_cols[MISC_COLUMN], entity_cols[MISC_COLUMN])
+        if misc != ud_cols[MISC_COLUMN]:
+            ud_cols[MISC_COLUMN] = misc
+            line = "\t".join(ud_cols) + "\n"
+        out.append(line)
+    out.append("\n")
+    return "".join(out)
+
+
+def _iter_matches(ud_sents: Iterable, entity_sents: Iterable, lookahead: int):
+    """
+    Advances over both sentence streams, matching every UD sentence with the
+    next source sentences. Works on anything with a TokenList-like metadata.
+
+    Yields:
+        the UD sentence, its Match (None if there is none), and the source
+        sentences it consumed
+    """
+    entity_iter = iter(entity_sents)
+    buffer = deque()
+
+    def fill(n: int) -> int:
+        while len(buffer) < n:
+            sent = next(entity_iter, None)
+            if sent is None:
+                break
+            buffer.append(sent)
+        return len(buffer)
+
+    for ud_sent in ud_sents:
+        if not fill(lookahead + 1):
+            raise IndexError(
+                f"No source sentence left to align with sentence {ud_sent.metadata['sent_id']}")
+        ud_text = ud_sent.metadata["text"]
+        entity_text = buffer[0].metadata["text"]
+
+        match, consumed = None, 1
+        if ud_text == entity_text:
+            match = Match.EQUAL
+        else:
+            # try to match the UD sent with the next source sents
+            # such that UD1 = source1 + source2 (+ ...)
+            joined_text = entity_text
+            for n_joined in range(2, len(buffer) + 1):
+                joined_text += buffer[n_joined - 1].metadata["text"]
+                if ud_text == joined_text:
+                    match, consumed = Match.JOINED, n_joined
+                    break
+        if match is None and ud_text == entity_text[1:]:
+            # we may get:
+            # En kampanje for "etnisk renskning" starter med at én nabo vender seg mot en annen.
+            # "En kampanje for "etnisk renskning" starter med at én nabo vender seg mot en annen.
+            # that is, the source sentence has an unnecessary token at the beginning. Ignore it!
+            match = Match.LEADING_TOKEN
+
+        yield ud_sent, match, [buffer.popleft() for _ in range(consumed)]
+
+
+def _report_mismatch(ud_sent, entity_sent) -> None:
+    instrumentation.count("mismatched_sentences")
+    diagnostics.report("mismatched_sentence", "Mismatched sentences on line {sentence}\n{ud_text}\n{source_text}",
+                       sentence=ud_sent.metadata["sent_id"], ud_text=ud_sent.metadata["text"],
+                       source_text=entity_sent.metadata["text"])
+
+
+def _align_parsed(ud_sent: TokenList, match: Optional[Match], entity_sents: List[TokenList]) -> TokenList:
+    meta = ud_sent.metadata  # we will modify the entire object, so save it
+    if match is Match.EQUAL:
+        aligned = merge_sentences(ud_sent, entity_sents[0])
+    elif match is Match.JOINED:
+        aligned = merge_sentences(ud_sent, TokenList([t for sent in entity_sents for t in sent]))
+    elif match is Match.LEADING_TOKEN:
+        aligned = merge_sentences(ud_sent, TokenList([t for t in entity_sents[0]][1:]))
+    else:
+        _report_mismatch(ud_sent, entity_sents[0])
+        aligned = ud_sent
+    aligned.metadata = meta
+    return aligned
+
+
+def iter_aligned_sentences(
+    ud_sents: Iterable[TokenList], entity_sents: Iterable[TokenList], lookahead: int = 1
+) -> Iterator[TokenList]:
+    """
+    Aligns a stream of UD sentences with a stream of source (e.g. NorNE)
+    sentences, yielding every UD sentence as soon as it is aligned. Only the
+    source sentences within the lookahead are kept in memory.
+
+    A UD sentence is matched with the current source sentence if
+    1. their texts are equal,
+    2. the source sentence is split across the current and the following
+       source sentences (UD1 = source1 + source2), up to `lookahead` of them,
+    3. the source sentence has an unnecessary token at the beginning.
+    UD sentences without a match are yielded as they are.
+
+    Args:
+        ud_sents (Iterable[TokenList]): The UD corpus.
+        entity_sents (Iterable[TokenList]): The source corpus.
+        lookahead (int): The number of following source sentences that may be
+            joined with the current one.
+
+    Returns:
+        Iterator[TokenList]: The aligned UD sentences, in order.
+    """
+    for ud_sent, match, consumed in _iter_matches(ud_sents, entity_sents, lookahead):
+        yield _align_parsed(ud_sent, match, consumed)
+
+
+def iter_aligned_raw(
+    ud_sents: Iterable[RawSentence], entity_sents: Iterable[RawSentence], lookahead: int = 1
+) -> Iterator[str]:
+    """
+    Like iter_aligned_sentences, but on the lines of the sentences. Sentences
+    with equal texts are merged by patching the MISC column of the UD lines,
+    everything else is parsed and merged by merge_sentences. Unmatched
+    UD sentences are passed through unchanged.
+
+    Returns:
+        Iterator[str]: The serialized aligned UD sentences, in order.
+    """
+    for ud_sent, match, consumed in _iter_matches(ud_sents, entity_sents, lookahead):
+        if match is None:
+            _report_mismatch(ud_sent, consumed[0])
+            yield ud_sent.serialize()
+            continue
+        if match is Match.EQUAL:
+            patched = patch_sentence(ud_sent, consumed[0])
+            if patched is not None:
+                yield patched
+                continue
+        aligned = _align_parsed(ud_sent.parse(), match, [sent.parse() for sent in consumed])
+        yield aligned.serialize()
+
+
+def align_sentences(
+    ud_data: Iterable[TokenList], entity_data: Iterable[TokenList], lookahead: int = 1
+) -> List[TokenList]:
+    """
+    Aligns the sentences in the UD and source corpora, see iter_aligned_sentences.
+
+    Returns:
+        List[TokenList]: The aligned data.
+    """
+    return list(iter_aligned_sentences(ud_data, entity_data, lookahead=lookahead))
+
+
+def align_files(
+    ud_path: str, entity_path: str, out: str, lookahead: int = 1, raw: bool = True
+) -> None:
+    """
+    Aligns a UD CoNLL-U file with a source CoNLL-U file, reading both and
+    writing the aligned sentences one at a time.
+
+    Args:
+        raw (bool): Merge on the lines of the files where possible (see
+            iter_aligned_raw), instead of parsing and serializing every sentence.
+    """
+    with open(ud_path, "r", encoding="utf-8") as ud_f, open(
+        entity_path, "r", encoding="utf-8"
+    ) as entity_f, open(out, "w", encoding="utf-8", newline="\n") as f:
+        if raw:
+            aligned = iter_aligned_raw(
+                read_raw_sentences(ud_f), read_raw_sentences(entity_f), lookahead=lookahead)
+        else:
+            aligned = (
+                sent.serialize()
+                for sent in iter_aligned_sentences(
+                    read_sentences(ud_f), read_sentences(entity_f), lookahead=lookahead)
+            )
+        n_sentences = 0
+        for sent in tqdm(aligned, unit=" sentences"):
+            f.write(sent)
+            n_sentences += 1
+    instrumentation.count("sentences", n_sentences)
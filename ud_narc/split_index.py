@@ -0,0 +1,118 @@
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from conllu import parse
+from conllu.models import TokenList
+
+INDEX_SUFFIX = ".index.json"
+
+
+@dataclass
+class DocumentEntry:
+    offset: int
+    length: int
+    sentences: int
+    tokens: int
+
+
+def index_path(conllu_path: str) -> str:
+    return f"{conllu_path}{INDEX_SUFFIX}"
+
+
+def document_stats(document: bytes) -> Tuple[Optional[str], int, int]:
+    """
+    Reads the document ID, sentence count and token count of a serialized
+    document. Multiword token ranges and empty nodes are not counted as tokens.
+
+    Returns:
+        Tuple[Optional[str], int, int]: the `# newdoc id`, if any, and the counts
+    """
+    doc_id = None
+    sentences = 0
+    tokens = 0
+    in_sentence = False
+    for line in document.split(b"\n"):
+        if not line.strip():
+            in_sentence = False
+            continue
+        if not in_sentence:
+            in_sentence = True
+            sentences += 1
+        if line.startswith(b"#"):
+            key, _, value = line[1:].decode("utf-8").partition("=")
+            if doc_id is None and key.strip() == "newdoc id":
+                doc_id = value.strip()
+        elif line.split(b"\t", 1)[0].isdigit():
+            tokens += 1
+    return doc_id, sentences, tokens
+
+
+def write_index(conllu_path: str, size: int, doc2entry: Dict[str, DocumentEntry]) -> None:
+    path = index_path(conllu_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        json.dump({
+            "file": os.path.basename(conllu_path),
+            "size": size,
+            "documents": {doc: asdict(entry) for doc, entry in doc2entry.items()},
+        }, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+class SplitReader:
+    """
+    Random access to the documents of a combined split file, through the
+    index written next to it by SplitWriter. Only the requested documents
+    are read and parsed.
+
+    Args:
+        conllu_path (str): the combined file
+    """
+
+    def __init__(self, conllu_path: str):
+        self.path = conllu_path
+        with open(index_path(conllu_path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        size = os.path.getsize(conllu_path)
+        if index["size"] != size:
+            raise ValueError(
+                f"The index of {conllu_path} is out of date ({index['size']} bytes indexed, {size} on disk)")
+        self.doc2entry: Dict[str, DocumentEntry] = {
+            doc: DocumentEntry(**entry) for doc, entry in index["documents"].items()
+        }
+
+    @property
+    def docs(self) -> List[str]:
+        # in file order
+        return list(self.doc2entry)
+
+    def __len__(self) -> int:
+        return len(self.doc2entry)
+
+    def __contains__(self, doc: str) -> bool:
+        return doc in self.doc2entry
+
+    def read_bytes(self, docs: Iterable[str]) -> Iterator[Tuple[str, bytes]]:
+        """
+        Reads the raw bytes of the given documents, in the order requested.
+        """
+        with open(self.path, "rb") as f:
+            for doc in docs:
+                entry = self.doc2entry[doc]
+                f.seek(entry.offset)
+                yield doc, f.read(entry.length)
+
+    def read_documents(self, docs: Iterable[str]) -> Iterator[Tuple[str, List[TokenList]]]:
+        """
+        Parses the given documents, in the order requested.
+
+        Returns:
+            Iterator[Tuple[str, List[TokenList]]]: the ID and sentences of each document
+        """
+        for doc, document in self.read_bytes(docs):
+            yield doc, parse(document.decode("utf-8"))
+
+    def read_document(self, doc: str) -> List[TokenList]:
+        return next(self.read_documents([doc]))[1]
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+import instrumentation
+from diagnostics import Diagnostic
+
+CODE_ROOT = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = ".stage_manifest.json"
+DIAGNOSTICS = ".stage_diagnostics.json"
+
+
+def _update_with_file(h, path: str) -> None:
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    """
+    Content hash of the pipeline code, such that any code change invalidates
+    every cached stage.
+
+    Returns:
+        str: hex digest of all Python sources in the ud_narc package
+    """
+    h = hashlib.sha256()
+    sources = []
+    for root, dirs, files in os.walk(CODE_ROOT):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        sources.extend(os.path.join(root, f) for f in files if f.endswith(".py"))
+    for path in sorted(sources):
+        h.update(os.path.relpath(path, CODE_ROOT).encode("utf-8"))
+        _update_with_file(h, path)
+    return h.hexdigest()
+
+
+def input_digest(paths: Iterable[str], *extra: str) -> str:
+    """
+    Content hash of a stage's inputs.
+
+    Args:
+        paths (Iterable[str]): input files; their names and contents are hashed in order
+        extra (str): any additional values the output depends on (parameters, ids)
+
+    Returns:
+        str: hex digest of the inputs and the current code version
+    """
+    h = hashlib.sha256(code_version().encode("utf-8"))
+    for value in extra:
+        h.update(b"\0")
+        h.update(value.encode("utf-8"))
+    for path in paths:
+        h.update(b"\0")
+        h.update(os.path.basename(path).encode("utf-8"))
+        h.update(b"\0")
+        _update_with_file(h, path)
+    return h.hexdigest()
+
+
+class StageCache:
+    """
+    A manifest of input digests, per stage and per item (document or stage),
+    from the last run that produced the outputs. An item is only rebuilt
+    if its inputs changed or its outputs are missing.
+
+    The diagnostics raised while building an item are kept along with it, and
+    recorded again in the running stage whenever the item is found fresh, such
+    that the diagnostics of every run cover all of its outputs.
+    """
+
+    def __init__(self, output_path: str, enabled: bool = True):
+        self.path = os.path.join(output_path, MANIFEST)
+        self.diagnostics_path = os.path.join(output_path, DIAGNOSTICS)
+        # when disabled, everything is rebuilt but the manifest is still updated
+        self.enabled = enabled
+        self.manifest: Dict[str, Dict[str, str]] = self._load(self.path)
+        self.diagnostics: Dict[str, Dict[str, List[dict]]] = self._load(self.diagnostics_path)
+
+    @staticmethod
+    def _load(path: str) -> dict:
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def is_fresh(self, stage: str, key: str, digest: str, outputs: Iterable[str] = ()) -> bool:
+        if not self.enabled:
+            return False
+        if self.manifest.get(stage, {}).get(key) != digest:
+            return False
+        if not all(os.path.exists(output) for output in outputs):
+            return False
+        for diagnostic in self.diagnostics.get(stage, {}).get(key, []):
+            instrumentation.record_diagnostic(Diagnostic(**diagnostic))
+        return True
+
+    def update(self, stage: str, key: str, digest: str, diagnostics: Iterable[Diagnostic] = ()) -> None:
+        self.manifest.setdefault(stage, {})[key] = digest
+        stage_diagnostics = self.diagnostics.setdefault(stage, {})
+        stage_diagnostics[key] = [asdict(diagnostic) for diagnostic in diagnostics]
+        if not stage_diagnostics[key]:
+            del stage_diagnostics[key]
+
+    @staticmethod
+    def _write(path: str, data: dict, **kwargs) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+            json.dump(data, f, **kwargs)
+        os.replace(tmp_path, path)
+
+    def save(self) -> None:
+        self._write(self.diagnostics_path, self.diagnostics, ensure_ascii=False)
+        # the manifest last, such that its items never lack their diagnostics
+        self._write(self.path, self.manifest, indent=1, sort_keys=True)
@@ -0,0 +1,79 @@
+from typing import Dict, Generic, Hashable, Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T", bound=Hashable)
+
+
+class UnionFind(Generic[T]):
+    """
+    A disjoint-set forest with path compression and union by size.
+
+    Items are kept in the order they were first added, which makes the
+    clusters independent of the order in which they were united.
+    """
+
+    def __init__(self, items: Iterable[T] = ()):
+        self.parent: Dict[T, T] = {}
+        self.size: Dict[T, int] = {}
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: T) -> bool:
+        return item in self.parent
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def add(self, item: T) -> None:
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item: T) -> T:
+        parent = self.parent
+        while parent[item] != item:
+            # path halving
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a: T, b: T) -> T:
+        """
+        Merges the clusters of a and b, adding them if they are new.
+
+        Returns:
+            T: the root of the merged cluster
+        """
+        self.add(a)
+        self.add(b)
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+        return root_a
+
+    def clusters(self) -> List[List[T]]:
+        """
+        Returns:
+            List[List[T]]: every cluster with its items in the order they were
+                added, ordered by their first item
+        """
+        root2cluster: Dict[T, List[T]] = {}
+        for item in self.parent:
+            root2cluster.setdefault(self.find(item), []).append(item)
+        return list(root2cluster.values())
+
+
+def cluster_links(links: Iterable[Tuple[T, T]]) -> List[List[T]]:
+    """
+    Groups linked items into clusters, the connected components of the links.
+
+    Returns:
+        List[List[T]]: the clusters, in order of first appearance in the links
+    """
+    union_find: UnionFind[T] = UnionFind()
+    for a, b in links:
+        union_find.union(a, b)
+    return union_find.clusters()
@@ -1,10 +1,15 @@
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, List
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
 
-from conllu import parse
-from conllu.models import SentenceList
+from conllu import parse_incr
+from conllu.models import TokenList
+
+import instrumentation
 
 SEP = "\t"
 NEWLINE = "\n"
@@ -23,19 +28,59 @@ class Paths:
     dev: str
 
 
-def get_ud_splits(
-    ud_folder: str, language: str
-) -> Dict[str, List[Dict[str, SentenceList]]]:
-    ud_id = f"no_{language}-ud-"
+def read_sentences(conllu_file: TextIO) -> Iterator[TokenList]:
+    """
+    Lazily parses the sentences of an open CoNLL-U file, one at a time.
+
+    Args:
+        conllu_file (TextIO): An open CoNLL-U file handle.
+
+    Returns:
+        Iterator[TokenList]: The parsed sentences, in file order.
+    """
+    yield from parse_incr(conllu_file)
+
 
-    ud_train = os.path.join(ud_folder, f"{ud_id}train.conllu")
-    ud_test = os.path.join(ud_folder, f"{ud_id}test.conllu")
-    ud_dev = os.path.join(ud_folder, f"{ud_id}dev.conllu")
+def _run_captured(func: Callable, args: tuple) -> Tuple[str, instrumentation.StageRecord]:
+    # progress bars of parallel jobs would only garble each other, drop them
+    with redirect_stdout(io.StringIO()) as out, redirect_stderr(io.StringIO()), \
+            instrumentation.collect() as record:
+        func(*args)
+    return out.getvalue(), record
+
+
+def run_jobs(func: Callable, jobs_args: List[tuple], jobs: Optional[int] = None) -> None:
+    """
+    Runs func once for every tuple of arguments, in a pool of worker processes.
+    What a job prints is collected and printed in job order, once the job and
+    all jobs before it are done, so the log reads like that of a serial run.
+
+    Args:
+        func (Callable): a module-level function, such that it can be pickled
+        jobs_args (List[tuple]): the arguments of each job
+        jobs (int, optional): the number of worker processes, all CPUs by default.
+            With 1, the jobs are run one after another in this process.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, max(len(jobs_args), 1))
+    if jobs == 1:
+        for args in jobs_args:
+            func(*args)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_run_captured, func, args) for args in jobs_args]
+        for future in futures:
+            output, record = future.result()
+            print(output, end="")
+            instrumentation.add(record)
+
+
+def get_ud_split_paths(ud_folder: str, language: str) -> Dict[str, str]:
+    ud_id = f"no_{language}-ud-"
 
     return {
-        "train": parse(open(ud_train, "r", encoding="utf-8").read()),
-        "test": parse(open(ud_test, "r", encoding="utf-8").read()),
-        "dev": parse(open(ud_dev, "r", encoding="utf-8").read()),
+        "train": os.path.join(ud_folder, f"{ud_id}train.conllu"),
+        "test": os.path.join(ud_folder, f"{ud_id}test.conllu"),
+        "dev": os.path.join(ud_folder, f"{ud_id}dev.conllu"),
     }
 
 
@@ -0,0 +1,70 @@
+import os
+from typing import Dict, Iterable
+
+from split_index import DocumentEntry, document_stats, write_index
+
+# large enough to hold most documents, which are written in one call
+BUFFER_SIZE = 1 << 20
+
+
+def join_document(pieces: Iterable[str]) -> bytes:
+    """
+    Joins the serialized pieces of a document (comments, sentences, lines)
+    into its encoded contents, in a single allocation.
+
+    Returns:
+        bytes: the UTF-8 encoded document
+    """
+    return "".join(pieces).encode("utf-8")
+
+
+def write_document(path: str, document: bytes) -> None:
+    with open(path, "wb", buffering=BUFFER_SIZE) as f:
+        f.write(document)
+
+
+class SplitWriter:
+    """
+    Streams documents into the combined CoNLL-U file of a split, in the order
+    they are written. The file is written next to its destination and only
+    moved in place when the writer is closed without errors, together with
+    its document index (see split_index.SplitReader).
+
+    Args:
+        path (str): the combined file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.offset = 0
+        self.doc2entry: Dict[str, DocumentEntry] = {}
+        self._file = None
+
+    def __enter__(self) -> "SplitWriter":
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.tmp_path, "wb", buffering=BUFFER_SIZE)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+            write_index(self.path, self.offset, self.doc2entry)
+        else:
+            os.remove(self.tmp_path)
+
+    def write_document(self, document: bytes) -> None:
+        doc_id, sentences, tokens = document_stats(document)
+        if doc_id is None:
+            raise ValueError(f"Document at byte {self.offset} of {self.path} has no newdoc id")
+        if doc_id in self.doc2entry:
+            raise ValueError(f"Document {doc_id} is written twice to {self.path}")
+        self.doc2entry[doc_id] = DocumentEntry(self.offset, len(document), sentences, tokens)
+        self._file.write(document)
+        self.offset += len(document)
+
+    def copy_document(self, path: str) -> None:
+        # documents written by an earlier run are copied as they are
+        with open(path, "rb") as f:
+            self.write_document(f.read())